@@ -0,0 +1,75 @@
+"""Micro-benchmark for the `datetime` Jinja filter.
+
+Renders N show rows through the same loop the /shows template uses, once
+with the old filter (strftime in the view, dateutil + babel.format_datetime
+in the filter) and once with the precompiled, memoised filter from
+fyyur/routes.py fed real datetime objects.
+
+    python benchmarks/bench_datetime_filter.py --rows 50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import dateutil.parser
+from babel.dates import format_datetime as babel_format_datetime
+from jinja2 import Environment
+from fyyur.routes import format_datetime, cached_format_datetime
+
+TEMPLATE = "{% for show in shows %}<h4>{{ show.start_time|datetime('full') }}</h4>{% endfor %}"
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel_format_datetime(date, format, locale='en')
+
+
+def render(filter, shows):
+    env = Environment()
+    env.filters['datetime'] = filter
+    template = env.from_string(TEMPLATE)
+    start = time.perf_counter()
+    html = template.render(shows=shows)
+    return time.perf_counter() - start, html
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--distinct', type=int, default=5000,
+                        help='number of distinct start times among the rows')
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    base = datetime(2030, 1, 1, 20, 0)
+    times = [base + timedelta(hours=rnd.randrange(args.distinct)) for _ in range(args.rows)]
+
+    # Views used to hand the template strings, the filter parsed them back
+    start = time.perf_counter()
+    legacy_shows = [{'start_time': value.strftime('%Y-%m-%d %H:%M:%S')} for value in times]
+    legacy_prepare = time.perf_counter() - start
+    legacy, legacy_html = render(legacy_format_datetime, legacy_shows)
+
+    shows = [{'start_time': value} for value in times]
+    cached_format_datetime.cache_clear()
+    cold, html = render(format_datetime, shows)
+    warm, _ = render(format_datetime, shows)
+    assert html == legacy_html
+
+    print('%d rows, %d distinct start times' % (args.rows, args.distinct))
+    print('%-28s %10.1f ms' % ('legacy (strftime + parse)', (legacy_prepare + legacy) * 1000))
+    print('%-28s %10.1f ms' % ('precompiled, cold cache', cold * 1000))
+    print('%-28s %10.1f ms' % ('precompiled, warm cache', warm * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""Matchmaking throughput benchmark.
+
+Builds random artist and venue features in memory (no database), runs the
+blocked scoring and top-K selection of fyyur/matching.py over every pair and
+reports the time, pairs per second and peak RSS.
+
+    python benchmarks/bench_matching.py --artists 100000 --venues 100000
+
+With --check it instead builds a synthetic catalogue (benchmarks/synthetic.py)
+in an SQLite database and checks the incremental refresh: booking shows and
+rolling the counters over leave nothing stale, and after rounds of random
+edits (genres, cities, seeking flags, new and deleted entities) refresh()
+gives the same lists as a full rebuild(). Lists are compared by their
+scores, so tied entries may differ.
+
+    python benchmarks/bench_matching.py --check --artists 2000 --venues 1000
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_DEBUG', '1')
+os.environ.setdefault('CACHE_BACKEND', 'null')
+
+import numpy as np
+from sqlalchemy import func
+from fyyur import create_app, db, matching
+from fyyur.counters import count_new_shows, uncount_shows, rollover
+from fyyur.geo import locate_venue
+from fyyur.matching import Features, unit_vectors, best_matches, TOP_K, ARTISTS, VENUES
+from fyyur.models import Venue, Artist, Show, Genre, DEFAULT_SHOW_DURATION
+from fyyur.queries import listing_version
+from synthetic import generate
+
+
+def random_features(rnd, count, genres, cities, states):
+    # Cities are grouped into states and sit within the contiguous US
+    centres = np.column_stack([rnd.uniform(25.0, 49.0, cities), rnd.uniform(-124.0, -67.0, cities)])
+    city = rnd.integers(0, cities, count)
+    bits = np.zeros((count, genres // 64 + 1), dtype=np.uint64)
+    for _ in range(3):
+        genre = rnd.integers(0, genres, count)
+        bits[np.arange(count), genre // 64] |= np.left_shift(np.uint64(1), (genre % 64).astype(np.uint64))
+    return Features(np.arange(1, count + 1, dtype=np.int64), bits, city, city % states,
+                    unit_vectors(centres[city, 0], centres[city, 1]))
+
+
+def match_lists(side):
+    # {owner id: its scores, best first}
+    lists = {}
+    for owner, score in db.session.query(side.owner, side.matches.c.score).order_by(side.owner,
+                                                                                    side.matches.c.score.desc()):
+        lists.setdefault(owner, []).append(score)
+    return lists
+
+
+def stale():
+    return matching.stale_ids(ARTISTS) | {-id for id in matching.stale_ids(VENUES)}
+
+
+def book_shows(rnd, count):
+    venue_ids = [id for (id,) in db.session.query(Venue.id)]
+    artist_ids = [id for (id,) in db.session.query(Artist.id)]
+    now = datetime.now()
+    shows = [Show(venue_id=rnd.choice(venue_ids), artist_id=rnd.choice(artist_ids),
+                  start_time=now + timedelta(minutes=rnd.randint(-60, 60 * 24 * 30)))
+             for _ in range(count)]
+    for show in shows:
+        show.end_time = show.start_time + DEFAULT_SHOW_DURATION
+    count_new_shows(shows)
+    db.session.add_all(shows)
+    db.session.commit()
+
+
+def edit(rnd, count):
+    # Edits as the forms and the importer make them
+    genres = Genre.query.all()
+    areas = db.session.query(Venue.city, Venue.state).distinct().all()
+    for model in (Artist, Venue):
+        for entity in model.query.order_by(func.random()).limit(count):
+            change = rnd.randrange(3)
+            if change == 0:
+                entity.genres = rnd.sample(genres, rnd.randint(1, 3))
+                entity.updated_at = datetime.now()
+            elif change == 1:
+                entity.city, entity.state = rnd.choice(areas)
+                if model is Venue:
+                    locate_venue(entity)
+            elif model is Venue:
+                entity.seeking_talent = not entity.seeking_talent
+            else:
+                entity.seeking_venue = not entity.seeking_venue
+    city, state = rnd.choice(areas)
+    db.session.add(Artist(name='New Band', city=city, state=state, facebook_link='https://www.facebook.com/new',
+                          seeking_venue=True, genres=rnd.sample(genres, 2)))
+    venue = Venue(name='New Hall', city=city, state=state, address='1 New St',
+                  facebook_link='https://www.facebook.com/new', seeking_talent=True, genres=rnd.sample(genres, 2))
+    locate_venue(venue)
+    db.session.add(venue)
+    # Deleted as the delete view does it
+    venue = Venue.query.filter(Venue.seeking_talent.is_(True)).order_by(func.random()).first()
+    uncount_shows(venue.shows)
+    matching.forget_venue(venue.id)
+    for show in venue.shows:
+        db.session.delete(show)
+    db.session.delete(venue)
+    db.session.commit()
+
+
+def check(args):
+    rnd = random.Random(args.seed)
+    with create_app().app_context():
+        generate(args.venues, args.artists, 4 * (args.venues + args.artists), seed=args.seed)
+        failures = []
+
+        before = listing_version(Venue)
+        book_shows(rnd, 100)
+        rollover(datetime.now() + timedelta(days=7))
+        db.session.commit()
+        if stale():
+            failures.append('booking shows and rolling over made %d artists/venues stale' % len(stale()))
+        if listing_version(Venue) == before:
+            failures.append('booking shows left the venue listing version unchanged')
+
+        for number in range(args.rounds):
+            edit(rnd, max(1, min(args.artists, args.venues) // 50))
+            matching.refresh(args.top_k)
+            db.session.commit()
+            refreshed = match_lists(ARTISTS), match_lists(VENUES)
+            matching.rebuild(args.top_k)
+            db.session.commit()
+            rebuilt = match_lists(ARTISTS), match_lists(VENUES)
+            for side, got, expected in zip(('artist', 'venue'), refreshed, rebuilt):
+                differ = [owner for owner in set(got) | set(expected)
+                                    if len(got.get(owner, [])) != len(expected.get(owner, []))
+                          or not np.allclose(got.get(owner, []), expected.get(owner, []), atol=1e-5)]
+                if differ:
+                    failures.append('round %d: %d %s lists differ from a rebuild, e.g. %s %d'
+                                    % (number + 1, len(differ), side, side, differ[0]))
+    for failure in failures:
+        print(failure)
+    print('%d rounds of edits: %s' % (args.rounds, 'FAILED' if failures else 'refresh matches rebuild'))
+    if failures:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--artists', type=int, default=20000)
+    parser.add_argument('--venues', type=int, default=20000)
+    parser.add_argument('--genres', type=int, default=19)
+    parser.add_argument('--cities', type=int, default=500)
+    parser.add_argument('--states', type=int, default=51)
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--check', action='store_true', help='check refresh() against rebuild() instead')
+    parser.add_argument('--rounds', type=int, default=3, help='rounds of edits with --check')
+    args = parser.parse_args()
+    if args.check:
+        return check(args)
+
+    rnd = np.random.default_rng(args.seed)
+    artists = random_features(rnd, args.artists, args.genres, args.cities, args.states)
+    venues = random_features(rnd, args.venues, args.genres, args.cities, args.states)
+    start = time.perf_counter()
+    (artist_best, artist_scores), (venue_best, venue_scores) = best_matches(artists, venues, args.top_k)
+    elapsed = time.perf_counter() - start
+    pairs = args.artists * args.venues
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = peak // 1024 if sys.platform == 'darwin' else peak
+    print('%d artists x %d venues: %.1fs, %.1fM pairs/s, peak RSS %.0f MB'
+          % (args.artists, args.venues, elapsed, pairs / elapsed / 1e6, peak / 1024.0))
+    print('best artist score %.3f, median top-1 %.3f'
+          % (artist_scores.max(), np.median(artist_scores.max(axis=1))))
+
+
+if __name__ == '__main__':
+    main()
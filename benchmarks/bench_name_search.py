@@ -0,0 +1,79 @@
+"""Benchmark for indexed substring search on venue/artist names.
+
+Seeds an SQLite database with N artists, builds the FTS5 trigram index from
+fyyur.search and times searches through the index against a plain ILIKE
+scan.
+
+    python benchmarks/bench_name_search.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_DEBUG', '1')
+
+from fyyur import create_app, db
+from fyyur.models import Artist
+from fyyur.search import create_sqlite_search_indexes, search_artists_by_name
+import fyyur.search
+
+app = create_app()
+
+WORDS = ['wild', 'sax', 'band', 'petals', 'guns', 'quevado', 'matt', 'blue', 'jazz', 'night',
+         'river', 'stone', 'echo', 'velvet', 'north', 'owl', 'brass', 'cafe', 'harbor']
+
+
+def seed(rows):
+    db.drop_all()
+    db.create_all()
+    rnd = random.Random(42)
+    batch = []
+    for i in range(rows):
+        batch.append({'name': '%s %s %d' % (rnd.choice(WORDS), rnd.choice(WORDS), i),
+                      'city': 'San Francisco', 'state': 'CA',
+                      'facebook_link': 'https://www.facebook.com/fyyur'})
+        if len(batch) == 50000:
+            db.session.execute(Artist.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Artist.__table__.insert(), batch)
+    db.session.commit()
+    create_sqlite_search_indexes(db.session.connection())
+    db.session.commit()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--terms', nargs='+', default=['quevado 1234', 'velvet owl 99', 'harbor 77777'])
+    args = parser.parse_args()
+
+    with app.app_context():
+        seed(args.rows)
+        print('%d artists' % args.rows)
+        print('%-16s %8s %12s %12s' % ('term', 'matches', 'indexed ms', 'ilike ms'))
+        for term in args.terms:
+            matches = search_artists_by_name(term)['count']
+            indexed = best_of(lambda: search_artists_by_name(term), args.repeat)
+            fyyur.search._fts_available[db.engine] = set()
+            scan = best_of(lambda: search_artists_by_name(term), args.repeat)
+            fyyur.search._fts_available.pop(db.engine)
+            print('%-16s %8d %12.2f %12.2f' % (term, matches, indexed, scan))
+
+
+if __name__ == '__main__':
+    main()
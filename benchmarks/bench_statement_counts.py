@@ -0,0 +1,113 @@
+"""Statement-count regression check for search and detail pages.
+
+Seeds SQLite with a growing number of matching venues/artists (each with a
+few past and upcoming shows), runs the venue/artist searches and detail
+pages for each size and records how many SQL statements each request issued.
+Exits non-zero if a count grows with the size of the data or goes over the
+page's limit.
+
+A search is one statement. A detail page is three: the page-version query
+of the conditional GET (fyyur/conditional.py), which runs on every request
+before the page is rendered or served from cache and so is part of what the
+page costs, then the venue/artist row and its shows joined to the other
+side (fyyur/queries.py).
+
+    python benchmarks/bench_statement_counts.py
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_DEBUG', '1')
+os.environ.setdefault('CACHE_BACKEND', 'null')
+
+from sqlalchemy import event
+from fyyur import create_app, db
+from fyyur.models import Venue, Artist, Show
+
+app = create_app()
+
+
+def seed(size, shows_per_row):
+    db.drop_all()
+    db.create_all()
+    common = {'city': 'San Francisco', 'state': 'CA', 'facebook_link': 'https://www.facebook.com/fyyur'}
+    db.session.execute(Venue.__table__.insert(),
+                       [dict(common, name='Band Hall %d' % i, address='%d Main St' % i)
+                        for i in range(size)])
+    db.session.execute(Artist.__table__.insert(),
+                       [dict(common, name='Band %d' % i) for i in range(size)])
+    # Every artist plays venue 1 and artist 1 plays every venue, so the
+    # detail pages of venue 1 / artist 1 grow with the size as well.
+    now = datetime.now()
+    pairs = [(i + 1, 1) for i in range(size)] + [(1, i + 1) for i in range(1, size)]
+    db.session.execute(Show.__table__.insert(),
+                       [{'artist_id': artist_id, 'venue_id': venue_id,
+                         'start_time': now + timedelta(days=j - shows_per_row // 2)}
+                        for artist_id, venue_id in pairs for j in range(shows_per_row)])
+    db.session.commit()
+
+
+def count_statements(client, url, search_term=None):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        start = time.perf_counter()
+        if search_term is None:
+            response = client.get(url)
+        else:
+            response = client.post(url, data={'search_term': search_term})
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, response.status_code
+    return len(statements), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 10, 100, 1000])
+    parser.add_argument('--shows-per-row', type=int, default=4)
+    args = parser.parse_args()
+
+    client = app.test_client()
+    # (label, url, search term, most statements allowed)
+    checks = [('venue search', '/venues/search', 'band', 1),
+              ('artist search', '/artists/search', 'band', 1),
+              ('venue page', '/venues/1', None, 3),
+              ('artist page', '/artists/1', None, 3)]
+    counts = dict((label, set()) for label, _, _, _ in checks)
+    print('%8s' % 'rows' + ''.join('%22s' % label for label, _, _, _ in checks))
+    for size in args.sizes:
+        line = '%8d' % size
+        with app.app_context():
+            seed(size, args.shows_per_row)
+            for label, url, search_term, _ in checks:
+                # Warm up once so one-off work (e.g. index detection) is not counted
+                count_statements(client, url, search_term)
+                statements, elapsed = count_statements(client, url, search_term)
+                counts[label].add(statements)
+                line += '%10d stmts %6.1fms' % (statements, elapsed * 1000)
+        print(line)
+
+    failed = [label for label, seen in counts.items() if len(seen) != 1]
+    if failed:
+        print('Statement count depends on result size for: ' + ', '.join(failed))
+    over = ['%s (%d > %d)' % (label, max(counts[label]), limit)
+            for label, _, _, limit in checks if max(counts[label]) > limit]
+    if over:
+        print('Statement count over the limit for: ' + ', '.join(over))
+    if failed or over:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark for the grouped /venues listing.
+
+Seeds an SQLite database with N venues spread across M cities and times the
+single-query grouping in fyyur.queries against the old nested loop.
+
+    python benchmarks/bench_venue_areas.py
+    python benchmarks/bench_venue_areas.py --sizes 100000:5000 --legacy-limit 0
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_DEBUG', '1')
+
+from fyyur import create_app, db
+from fyyur.models import Venue
+from fyyur.queries import venue_areas
+
+app = create_app()
+
+
+def seed(venues, cities):
+    db.drop_all()
+    db.create_all()
+    rows = []
+    for i in range(venues):
+        city = i % cities
+        rows.append({
+            'name': 'Venue %d' % i,
+            'city': 'City %d' % city,
+            'state': 'S%02d' % (city % 50),
+            'address': '%d Main St' % i,
+            'facebook_link': 'https://www.facebook.com/venue%d' % i,
+        })
+    db.session.execute(Venue.__table__.insert(), rows)
+    db.session.commit()
+
+
+def legacy_venue_areas():
+    # The pre-optimisation implementation, kept for comparison only
+    areas = [{'city': city, 'state': state}
+             for state, city in db.session.query(Venue.state, Venue.city).distinct().all()]
+    venues = Venue.query.all()
+    for area in areas:
+        area['venues'] = [{'id': v.id, 'name': v.name} for v in venues
+                          if v.city == area['city'] and v.state == area['state']]
+    return areas
+
+
+def timeit(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['1000:50', '10000:500', '100000:5000'],
+                        help='venues:cities pairs to benchmark')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--legacy-limit', type=int, default=10000,
+                        help='skip the nested-loop version above this many venues')
+    args = parser.parse_args()
+
+    with app.app_context():
+        print('%10s %8s %12s %14s %12s' % ('venues', 'cities', 'grouped ms', 'us per venue', 'legacy ms'))
+        for size in args.sizes:
+            venues, cities = (int(part) for part in size.split(':'))
+            seed(venues, cities)
+            grouped = timeit(venue_areas, args.repeat)
+            legacy = '-'
+            if venues <= args.legacy_limit:
+                legacy = '%.1f' % (timeit(legacy_venue_areas, 1) * 1000)
+            print('%10d %8d %12.1f %14.2f %12s' % (venues, cities, grouped * 1000,
+                                                   grouped * 1e6 / venues, legacy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Seeded synthetic catalogue for the benchmarks.
+
+generate() drops and recreates every table of the app's database and fills
+it with venues, artists and shows. The same seed and counts always produce
+the same rows, so results of different commits are comparable. Genres follow
+a Zipf-like distribution: genre i is picked with weight 1 / (i + 1) ** skew,
+so skew=0 is uniform and higher values make a few genres dominate.
+
+    python benchmarks/synthetic.py --venues 1000 --artists 2000 --shows 20000
+
+Only use a scratch database: it is dropped and recreated.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from fyyur import db
+from fyyur.forms import genres_choices, state_choices
+from fyyur.models import Venue, Artist, Show, Genre, Place, DEFAULT_SHOW_DURATION, venue_genres, artist_genres
+from fyyur.search import create_sqlite_search_indexes
+from fyyur.counters import rebuild
+from fyyur.geo import location_values, place_key
+from fyyur import matching
+
+GENRES = [name for name, _ in genres_choices]
+WORDS = ['Blue', 'Velvet', 'Electric', 'Golden', 'Midnight', 'Wild', 'Silver', 'Crimson', 'Hollow', 'Neon',
+         'Royal', 'Rusty', 'Lucky', 'Quiet', 'Broken', 'Stone', 'River', 'Echo', 'Paper', 'Iron']
+VENUE_KINDS = ['Hall', 'Lounge', 'Club', 'Theatre', 'Bar', 'Room', 'Arena', 'Stage']
+ARTIST_KINDS = ['Band', 'Trio', 'Quartet', 'Collective', 'Orchestra', 'Project', 'Ensemble', 'Sound']
+BATCH_SIZE = 5000
+
+
+def image_link(kind, id):
+    return 'https://images.example.com/%ss/%d.jpg' % (kind, id - 1)
+
+
+def write_images(root, venues, artists, seed=42, size=(1200, 900), distinct=16):
+    # Source pictures for the image proxy's file fetcher (IMAGE_FILE_ROOT),
+    # where image_link points. A few colour gradients are encoded once; each
+    # file appends its own trailer after the end of the JPEG, so every file
+    # still has its own sha256 and gets its own thumbnails.
+    from io import BytesIO
+    from PIL import Image
+    rnd = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize(size)
+    pictures = []
+    for _ in range(distinct):
+        start = Image.new('RGB', size, tuple(rnd.randint(0, 255) for _ in range(3)))
+        end = Image.new('RGB', size, tuple(rnd.randint(0, 255) for _ in range(3)))
+        output = BytesIO()
+        Image.composite(start, end, gradient).save(output, 'JPEG', quality=90)
+        pictures.append(output.getvalue())
+    for kind, count in (('venue', venues), ('artist', artists)):
+        for id in range(1, count + 1):
+            path = os.path.join(root, *image_link(kind, id).split('://', 1)[1].split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(pictures[rnd.randrange(distinct)] + ('%s %d' % (kind, id)).encode('ascii'))
+
+
+def insert(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def pick_genres(rnd, weights):
+    count = rnd.choice((1, 1, 2, 2, 3))
+    return set(rnd.choices(range(len(GENRES)), weights=weights, k=count))
+
+
+def generate(venues=500, artists=1000, shows=10000, cities=50, genre_skew=1.0, seed=42, now=None):
+    rnd = random.Random(seed)
+    now = now or datetime.now().replace(microsecond=0)
+    weights = [1.0 / (i + 1) ** genre_skew for i in range(len(GENRES))]
+    states = [code for code, _ in state_choices]
+    areas = [('City %d' % i, states[i % len(states)]) for i in range(cities)]
+    # City centres within the contiguous US, drawn from their own generator
+    # so the other rows do not depend on them
+    places_rnd = random.Random(seed + 1)
+    centres = dict((area, (round(places_rnd.uniform(25.0, 49.0), 5), round(places_rnd.uniform(-124.0, -67.0), 5)))
+                   for area in areas)
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        db.session.commit()
+    db.drop_all()
+    db.create_all()
+
+    insert(Genre.__table__, [{'id': i + 1, 'name': name} for i, name in enumerate(GENRES)])
+    insert(Place.__table__, [{'city': place_key(city), 'state': state, 'latitude': latitude, 'longitude': longitude}
+                             for (city, state), (latitude, longitude) in centres.items()])
+
+    rows, links = [], []
+    for i in range(venues):
+        city, state = rnd.choice(areas)
+        rows.append({
+            'id': i + 1,
+            'name': 'The %s %s %d' % (rnd.choice(WORDS), rnd.choice(VENUE_KINDS), i),
+            'city': city,
+            'state': state,
+            'address': '%d %s St' % (rnd.randint(1, 9999), rnd.choice(WORDS)),
+            'phone': '%03d-%03d-%04d' % (rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+            'facebook_link': 'https://www.facebook.com/venue%d' % i,
+            'image_link': image_link('venue', i + 1),
+            'seeking_talent': rnd.random() < 0.3,
+        })
+        rows[-1].update(location_values(centres[(city, state)]))
+        links.extend({'venue_id': i + 1, 'genre_id': genre + 1} for genre in pick_genres(rnd, weights))
+    insert(Venue.__table__, rows)
+    insert(venue_genres, links)
+
+    rows, links = [], []
+    for i in range(artists):
+        city, state = rnd.choice(areas)
+        rows.append({
+            'id': i + 1,
+            'name': '%s %s %d' % (rnd.choice(WORDS), rnd.choice(ARTIST_KINDS), i),
+            'city': city,
+            'state': state,
+            'phone': '%03d-%03d-%04d' % (rnd.randint(200, 999), rnd.randint(0, 999), rnd.randint(0, 9999)),
+            'facebook_link': 'https://www.facebook.com/artist%d' % i,
+            'image_link': image_link('artist', i + 1),
+            'seeking_venue': rnd.random() < 0.3,
+        })
+        links.extend({'artist_id': i + 1, 'genre_id': genre + 1} for genre in pick_genres(rnd, weights))
+    insert(Artist.__table__, rows)
+    insert(artist_genres, links)
+
+    # Shows spread over a year either side of now, on the hour
+    shows = [{
+        'id': i + 1,
+        'venue_id': rnd.randint(1, venues),
+        'artist_id': rnd.randint(1, artists),
+        'start_time': now + timedelta(hours=rnd.randint(-365 * 24, 365 * 24)),
+    } for i in range(shows)]
+    for show in shows:
+        show['end_time'] = show['start_time'] + DEFAULT_SHOW_DURATION
+    insert(Show.__table__, shows)
+    rebuild(now)
+    matching.rebuild()
+
+    if db.engine.dialect.name == 'postgresql':
+        # Explicit ids do not advance the sequences
+        for table in ('genre', 'venue', 'artist', 'show'):
+            db.session.execute(text("SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), "
+                                    "(SELECT max(id) FROM \"%s\"))" % (table, table)))
+    elif db.engine.dialect.name == 'sqlite':
+        create_sqlite_search_indexes(db.session.connection())
+    db.session.commit()
+
+
+def add_arguments(parser):
+    parser.add_argument('--venues', type=int, default=500)
+    parser.add_argument('--artists', type=int, default=1000)
+    parser.add_argument('--shows', type=int, default=10000)
+    parser.add_argument('--cities', type=int, default=50)
+    parser.add_argument('--genre-skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def main():
+    os.environ.setdefault('FLASK_DEBUG', '1')
+    from fyyur import create_app
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+    with create_app().app_context():
+        generate(args.venues, args.artists, args.shows, args.cities, args.genre_skew, args.seed)
+        print('%d venues, %d artists, %d shows written to %s'
+              % (args.venues, args.artists, args.shows, db.engine.url.render_as_string(hide_password=True)))
+
+
+if __name__ == '__main__':
+    main()
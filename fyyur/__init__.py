@@ -2,22 +2,57 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 # from flask_moment import Moment
-from config import Config
-# from fyyur.models import db
-
-
-app = Flask(__name__)
-# moment = Moment(app)
-
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-# db.init_app(app)
-
-migrate = Migrate(app, db)
-
-
-# Avoid circulation
-from fyyur import routes
-
-
-
+from config import Config, engine_options
+from fyyur.cache import ResponseCache
+from fyyur.suggest import Suggestions
+from fyyur.instrument import SQLInstrumentation
+from fyyur.metrics import Metrics
+from fyyur.images import ImageProxy
+from fyyur.logs import configure_logging
+
+
+# Extensions are created unbound and attached to each app in create_app()
+db = SQLAlchemy()
+migrate = Migrate()
+cache = ResponseCache()
+suggestions = Suggestions()
+instrumentation = SQLInstrumentation(db)
+metrics = Metrics()
+images = ImageProxy()
+
+
+def create_app(config=Config):
+    app = Flask(__name__)
+    # moment = Moment(app)
+
+    app.config.from_object(config)
+    # Pool settings for the database this app uses, unless the config has its own
+    if 'SQLALCHEMY_ENGINE_OPTIONS' not in app.config:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    configure_logging(app)
+    # Before db.init_app: it picks the pool class of the engine
+    metrics.init_app(app)
+    db.init_app(app)
+    instrumentation.init_app(app)
+    migrate.init_app(app, db)
+    cache.init_app(app)
+    suggestions.init_app(app)
+    images.init_app(app)
+
+    # Avoid circulation
+    from fyyur.routes import bp
+    from fyyur.api import api
+    app.register_blueprint(bp)
+    app.register_blueprint(api)
+    from fyyur.importer import import_command
+    from fyyur.export import export_command
+    from fyyur.counters import counters_command
+    from fyyur.geo import geocode_command
+    from fyyur.matching import matches_command
+    app.cli.add_command(import_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(counters_command)
+    app.cli.add_command(geocode_command)
+    app.cli.add_command(matches_command)
+
+    return app
@@ -0,0 +1,296 @@
+from flask import Blueprint, current_app, request, jsonify, abort
+from sqlalchemy import and_, or_, tuple_
+from fyyur import db
+from fyyur.models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+from fyyur.queries import (
+    shows_with_counterpart,
+    split_page,
+    encode_show_cursor,
+    decode_show_cursor,
+    listing_version,
+    shows_version,
+    venue_version,
+    artist_version
+)
+from fyyur.conditional import conditional_get
+from fyyur.export import jsonl_value
+from fyyur.geo import locate, venues_near
+from fyyur.matching import ARTISTS, VENUES, TOP_K
+from fyyur.routes import page_size
+
+
+#----------------------------------------------------------------------------#
+# JSON API (v1).
+#----------------------------------------------------------------------------#
+
+# Read-only JSON views of venues, artists and shows. Every resource has a
+# schema: an ordered mapping of field name -> column. A request selects
+# fields with ?fields=a,b,c (all of them by default) and the query projects
+# exactly those columns, so rows come back as tuples and are serialised by
+# zipping them with the field names, without loading ORM objects. Genres
+# are fetched for a whole page in one extra query; detail routes can also
+# include the past/upcoming shows.
+#
+# Listings are keyset paginated (?after=, ?limit=) like the HTML pages and
+# return {'data': [...], 'next': cursor or null}.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+class Schema(object):
+
+    def __init__(self, model, columns, genre_table=None, genre_fk=None, relations=()):
+        self.model = model
+        self.columns = columns
+        self.genre_table = genre_table
+        self.genre_fk = genre_fk
+        # Fields only available on detail routes, built by the view
+        self.relations = relations
+        self.fields = list(columns) + (['genres'] if genre_table is not None else [])
+
+    def selected_fields(self, detail=False):
+        available = self.fields + (list(self.relations) if detail else [])
+        if not request.args.get('fields'):
+            return available
+        fields = list(dict.fromkeys(field.strip() for field in request.args['fields'].split(',') if field.strip()))
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            abort(400, 'Unknown fields: %s. Available: %s' % (', '.join(unknown), ', '.join(available)))
+        return fields
+
+    def query(self, fields):
+        # id is always selected; it is the pagination key and links genres
+        columns = [field for field in fields if field in self.columns]
+        query = db.session.query(self.model.id, *[self.columns[field] for field in columns])
+        return query, columns
+
+    def genres_by_id(self, ids):
+        genres = {id: [] for id in ids}
+        rows = db.session.query(self.genre_fk, Genre.name)\
+            .join(Genre, Genre.id == self.genre_table.c.genre_id)\
+            .filter(self.genre_fk.in_(ids))\
+            .order_by(Genre.name)
+        for id, name in rows:
+            genres[id].append(name)
+        return genres
+
+    def serialize(self, rows, fields, columns):
+        data = [dict(zip(columns, [jsonl_value(value) for value in row[1:]])) for row in rows]
+        if 'genres' in fields and rows:
+            genres = self.genres_by_id([row[0] for row in rows])
+            for row, item in zip(rows, data):
+                item['genres'] = genres[row[0]]
+        return data
+
+
+def entity_columns(model, *names):
+    return dict((name, getattr(model, name)) for name in ('id', 'name', 'city', 'state') + names)
+
+
+VENUE_SCHEMA = Schema(Venue,
+                      entity_columns(Venue, 'address', 'phone', 'facebook_link', 'image_link', 'website',
+                                     'seeking_talent', 'seeking_description', 'upcoming_shows_count',
+                                     'past_shows_count', 'latitude', 'longitude', 'updated_at'),
+                      venue_genres, venue_genres.c.venue_id,
+                      relations=('past_shows', 'upcoming_shows'))
+
+ARTIST_SCHEMA = Schema(Artist,
+                       entity_columns(Artist, 'phone', 'facebook_link', 'image_link', 'website',
+                                      'seeking_venue', 'seeking_description', 'upcoming_shows_count',
+                                      'past_shows_count', 'updated_at'),
+                       artist_genres, artist_genres.c.artist_id,
+                       relations=('past_shows', 'upcoming_shows'))
+
+SHOW_SCHEMA = Schema(Show, {
+    'id': Show.id,
+    'venue_id': Show.venue_id,
+    'venue_name': Venue.name,
+    'artist_id': Show.artist_id,
+    'artist_name': Artist.name,
+    'artist_image_link': Artist.image_link,
+    'start_time': Show.start_time,
+    'end_time': Show.end_time,
+})
+
+
+def entity_list(schema):
+    # ?min_upcoming=N keeps rows with at least N upcoming shows; ?sort=upcoming
+    # orders by upcoming show count (most first, then newest), paged by a
+    # "<count>_<id>" cursor. Both read the maintained counters (fyyur/counters.py).
+    fields = schema.selected_fields()
+    model = schema.model
+    limit = page_size()
+    query, columns = schema.query(fields)
+    min_upcoming = request.args.get('min_upcoming', type=int)
+    if min_upcoming is not None:
+        query = query.filter(model.upcoming_shows_count >= min_upcoming)
+
+    if request.args.get('sort') == 'upcoming':
+        query = query.add_columns(model.upcoming_shows_count)\
+            .order_by(model.upcoming_shows_count.desc(), model.id.desc())
+        if request.args.get('after'):
+            try:
+                count, id = (int(part) for part in request.args['after'].split('_'))
+            except ValueError:
+                abort(400, 'Malformed cursor')
+            query = query.filter(or_(model.upcoming_shows_count < count,
+                                     and_(model.upcoming_shows_count == count, model.id < id)))
+        rows, last = split_page(query.limit(limit + 1).all(), limit)
+        return jsonify({'data': schema.serialize([row[:-1] for row in rows], fields, columns),
+                        'next': '%d_%d' % (last[-1], last[0]) if last else None})
+
+    after = request.args.get('after', type=int)
+    query = query.order_by(model.id)
+    if after is not None:
+        query = query.filter(model.id > after)
+    rows, last = split_page(query.limit(limit + 1).all(), limit)
+    return jsonify({'data': schema.serialize(rows, fields, columns), 'next': last[0] if last else None})
+
+
+def entity_detail(schema, entity_id, show_fk, counterpart, prefix):
+    fields = schema.selected_fields(detail=True)
+    query, columns = schema.query(fields)
+    row = query.filter(schema.model.id == entity_id).one_or_none()
+    if row is None:
+        abort(404)
+    data = schema.serialize([row], fields, columns)[0]
+    if 'past_shows' in fields or 'upcoming_shows' in fields:
+        past_shows, upcoming_shows = shows_with_counterpart(show_fk, entity_id, counterpart, prefix)
+        for name, shows in (('past_shows', past_shows), ('upcoming_shows', upcoming_shows)):
+            if name in fields:
+                data[name] = [dict((key, jsonl_value(value)) for key, value in show.items()) for show in shows]
+    return jsonify({'data': data})
+
+
+@api.route('/venues')
+@conditional_get(lambda: listing_version(Venue))
+def venues():
+    return entity_list(VENUE_SCHEMA)
+
+
+def nearby_version():
+    # The centre of ?city=&state= comes from the place table, which
+    # `flask geocode load` changes without touching any venue
+    version = tuple(listing_version(Venue))
+    if request.args.get('city') and request.args.get('state'):
+        version += (locate(request.args['city'], request.args['state']),)
+    return version
+
+
+@api.route('/venues/near')
+@conditional_get(nearby_version)
+def venues_nearby():
+    # Nearest venues within ?radius= miles (default NEAR_RADIUS) of ?lat=&lng=
+    # or of the centre of ?city=&state=, closest first, at most ?limit=
+    config = current_app.config
+    if request.args.get('city') and request.args.get('state'):
+        center = locate(request.args['city'], request.args['state'])
+        if center is None:
+            abort(404, 'Unknown place: %s, %s' % (request.args['city'], request.args['state']))
+    else:
+        latitude, longitude = request.args.get('lat', type=float), request.args.get('lng', type=float)
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            abort(400, 'Give lat and lng in degrees, or city and state')
+        center = (latitude, longitude)
+    radius = request.args.get('radius', config['NEAR_RADIUS'], type=float)
+    if not 0 < radius <= config['MAX_NEAR_RADIUS']:
+        abort(400, 'radius must be between 0 and %s miles' % config['MAX_NEAR_RADIUS'])
+
+    fields = VENUE_SCHEMA.selected_fields()
+    query, columns = VENUE_SCHEMA.query(fields)
+    near = venues_near(query, center[0], center[1], radius, page_size())
+    data = VENUE_SCHEMA.serialize([row for _, row in near], fields, columns)
+    for (distance, _), item in zip(near, data):
+        item['distance_miles'] = round(distance, 2)
+    return jsonify({'data': data, 'center': {'latitude': center[0], 'longitude': center[1]}, 'radius': radius})
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional_get(venue_version)
+def venue(venue_id):
+    return entity_detail(VENUE_SCHEMA, venue_id, Show.venue_id, Artist, 'artist')
+
+
+@api.route('/artists')
+@conditional_get(lambda: listing_version(Artist))
+def artists():
+    return entity_list(ARTIST_SCHEMA)
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional_get(artist_version)
+def artist(artist_id):
+    return entity_detail(ARTIST_SCHEMA, artist_id, Show.artist_id, Venue, 'venue')
+
+
+def match_list(side, counterpart, owner_id):
+    # Best matches of an artist or venue, from the lists fyyur/matching.py
+    # keeps; empty for one that is not seeking
+    if db.session.query(side.model.id).filter(side.model.id == owner_id).first() is None:
+        abort(404)
+    limit = max(1, min(request.args.get('limit', TOP_K, type=int), TOP_K))
+    rows = db.session.query(counterpart.id, counterpart.name, counterpart.city, counterpart.state,
+                            counterpart.image_link, side.matches.c.score)\
+        .join(side.matches, side.candidate == counterpart.id)\
+        .filter(side.owner == owner_id)\
+        .order_by(side.matches.c.score.desc(), counterpart.id)\
+        .limit(limit)
+    return jsonify({'data': [{'id': id, 'name': name, 'city': city, 'state': state, 'image_link': image_link,
+                              'score': round(score, 4)}
+                             for id, name, city, state, image_link, score in rows]})
+
+
+@api.route('/artists/<int:artist_id>/matches')
+def artist_matches(artist_id):
+    return match_list(ARTISTS, Venue, artist_id)
+
+
+@api.route('/venues/<int:venue_id>/matches')
+def venue_matches(venue_id):
+    return match_list(VENUES, Artist, venue_id)
+
+
+def show_query(fields):
+    query, columns = SHOW_SCHEMA.query(fields)
+    if {'venue_name'} & set(columns):
+        query = query.join(Venue, Show.venue_id == Venue.id)
+    if {'artist_name', 'artist_image_link'} & set(columns):
+        query = query.join(Artist, Show.artist_id == Artist.id)
+    # start_time is needed for the cursor even when it is not returned
+    return query.add_columns(Show.start_time), columns
+
+
+@api.route('/shows')
+@conditional_get(shows_version)
+def shows():
+    fields = SHOW_SCHEMA.selected_fields()
+    after = None
+    if request.args.get('after'):
+        try:
+            after = decode_show_cursor(request.args['after'])
+        except ValueError:
+            abort(400, 'Malformed cursor')
+    limit = page_size()
+    query, columns = show_query(fields)
+    query = query.order_by(Show.start_time, Show.id)
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+    rows, last = split_page(query.limit(limit + 1).all(), limit)
+    return jsonify({'data': SHOW_SCHEMA.serialize([row[:-1] for row in rows], fields, columns),
+                    'next': encode_show_cursor(last[-1], last[0]) if last else None})
+
+
+@api.route('/shows/<int:show_id>')
+def show(show_id):
+    fields = SHOW_SCHEMA.selected_fields()
+    query, columns = show_query(fields)
+    row = query.filter(Show.id == show_id).one_or_none()
+    if row is None:
+        abort(404)
+    return jsonify({'data': SHOW_SCHEMA.serialize([row[:-1]], fields, columns)[0]})
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.description}), error.code
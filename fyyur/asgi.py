@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.exceptions import HTTPException
+from config import Config
+from fyyur import create_app, db, instrumentation
+
+
+#----------------------------------------------------------------------------#
+# ASGI serving.
+#----------------------------------------------------------------------------#
+
+# Optional deployment mode for an ASGI server:
+#
+#     uvicorn --factory 'fyyur.asgi:create_asgi_app' --workers 4
+#
+# It needs uvicorn, greenlet and the async driver of the database (asyncpg
+# for PostgreSQL, aiosqlite for SQLite), none of which the sync deployment
+# uses.
+#
+# The read pages (READ_ENDPOINTS: listings, searches and detail pages) are
+# served on the event loop. Their unchanged Flask views run inside
+# AsyncSession.run_sync(), with db.session pointed at its sync Session whose
+# statements go through the async driver, so while one request waits on the
+# database the worker carries on with the others instead of tying up a
+# thread each. Every other request (forms, writes, the API, exports, static
+# files) runs on a pool of ASGI_THREADS threads against the sync engine,
+# exactly as under gunicorn.
+#
+# Only the database I/O of the read pages is asynchronous: rendering and the
+# response cache still run on the event loop, so run several workers and
+# keep a slow cache backend away from them. Statement timings (Server-Timing,
+# SQL_WARN_DB_MS) include the time the loop takes to come back to a request.
+# The gain is in overlapping database round trips, so it shows with a
+# networked database; a local SQLite file has little latency to hide.
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+READ_ENDPOINTS = frozenset([
+    'main.venues', 'main.search_venues', 'main.show_venue',
+    'main.artists', 'main.search_artists', 'main.show_artist',
+    'main.shows',
+])
+
+
+def async_database_url(url):
+    # The same database through its async driver
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('No async driver for %s databases, set ASYNC_DATABASE_URL' % backend)
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def wsgi_environ(scope, body):
+    path, root_path = scope['path'], scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else 'HTTP_' + name
+        value = value.decode('latin-1')
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def start_app(app, environ):
+    # Calls the WSGI app; returns the ASGI status and headers and the body iterable
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]),
+                      [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+    result = app(environ, start_response)
+    return started[0], started[1], result
+
+
+class ASGIApp(object):
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_THREADS', 8), thread_name_prefix='fyyur-sync')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type %s' % scope['type'])
+        environ = wsgi_environ(scope, await read_body(receive))
+        if self.endpoint(environ) in READ_ENDPOINTS:
+            await self.call_async(environ, send)
+        else:
+            await self.call_threaded(environ, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def endpoint(self, environ):
+        try:
+            return self.app.url_map.bind_to_environ(environ).match()[0]
+        except HTTPException:
+            return None
+
+    async def call_async(self, environ, send):
+        session = AsyncSession(self.engine)
+        try:
+            status, headers, body = await session.run_sync(self.run_read, environ)
+        finally:
+            await session.close()
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def run_read(self, session, environ):
+        # Runs in the greenlet of run_sync(). The request context reuses this
+        # app context, whose teardown closes the session.
+        with self.app.app_context():
+            db.session.registry.set(session)
+            status, headers, result = start_app(self.app, environ)
+            try:
+                body = b''.join(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        return status, headers, body
+
+    async def call_threaded(self, environ, send):
+        # Every step runs in the same copy of the context, which
+        # stream_with_context() responses (exports) rely on when their chunks
+        # are produced by different threads
+        context = contextvars.copy_context()
+        status, headers, result = await self.in_thread(context, start_app, self.app, environ)
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            chunks = iter(result)
+            while True:
+                chunk = await self.in_thread(context, next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                await self.in_thread(context, result.close)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    def in_thread(self, context, function, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, context.run, function, *args)
+
+
+def create_asgi_app(config=Config):
+    app = create_app(config)
+    with app.app_context():
+        # db.engine.url has relative SQLite paths already resolved
+        url = app.config.get('ASYNC_DATABASE_URL') or async_database_url(db.engine.url)
+    # Same pool settings; the metered pool of fyyur/metrics.py is sync only
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    options.pop('poolclass', None)
+    engine = create_async_engine(url, **options)
+    if app.config.get('SQL_INSTRUMENTATION', True):
+        instrumentation.instrument(engine.sync_engine)
+    return ASGIApp(app, engine)
@@ -0,0 +1,73 @@
+from bisect import bisect_left, insort
+from sqlalchemy import or_
+from fyyur import db
+from fyyur.models import Venue, Artist, Show, MAX_SHOW_DURATION
+
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# A show occupies its venue and its artist from start_time to end_time, and
+# no two shows of the same venue or artist may overlap. Shows last at most
+# MAX_SHOW_DURATION, so any show overlapping [start, end) starts in
+# [start - MAX_SHOW_DURATION, end): the check is a range scan of the
+# (venue_id, start_time) and (artist_id, start_time) indexes, O(log n) in
+# the number of shows the venue or artist ever had, whatever their history.
+#
+# lock_bookings() locks the venue and artist rows (SELECT ... FOR UPDATE,
+# a no-op on SQLite where writes are serialised anyway) so two concurrent
+# bookings of the same venue or artist cannot both pass the check; the
+# locks are held until the transaction ends.
+
+
+def lock_bookings(venue_ids, artist_ids):
+    # Returns the ids of the venues and artists that exist. Rows are locked
+    # in a fixed order (venues, then artists, by id) to avoid deadlocks.
+    venues = {id for (id,) in db.session.query(Venue.id).filter(Venue.id.in_(set(venue_ids)))
+              .order_by(Venue.id).with_for_update()}
+    artists = {id for (id,) in db.session.query(Artist.id).filter(Artist.id.in_(set(artist_ids)))
+               .order_by(Artist.id).with_for_update()}
+    return venues, artists
+
+
+def overlapping_shows(venue_id, artist_id, start_time, end_time):
+    # Stored shows of the venue or the artist overlapping [start_time, end_time)
+    return Show.query\
+        .filter(or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+                Show.start_time > start_time - MAX_SHOW_DURATION,
+                Show.start_time < end_time,
+                Show.end_time > start_time)\
+        .order_by(Show.start_time)\
+        .all()
+
+
+def conflict_messages(venue_id, artist_id, shows):
+    messages = []
+    for show in shows:
+        who = 'Venue %s' % venue_id if show.venue_id == venue_id else 'Artist %s' % artist_id
+        messages.append('%s is already booked from %s to %s (show %s)'
+                        % (who, show.start_time, show.end_time, show.id))
+    return messages
+
+
+class BookingIndex(object):
+    # In-memory interval index of the shows accepted so far in a batch: per
+    # venue and per artist a list of (start, end) sorted by start. Lookups
+    # bisect to the shows starting in [start - MAX_SHOW_DURATION, end).
+
+    def __init__(self):
+        self.intervals = {}
+
+    def overlaps(self, key, start_time, end_time):
+        intervals = self.intervals.get(key, [])
+        position = bisect_left(intervals, (start_time - MAX_SHOW_DURATION,))
+        for start, end in intervals[position:]:
+            if start >= end_time:
+                break
+            if end > start_time:
+                return start, end
+        return None
+
+    def add(self, key, start_time, end_time):
+        insort(self.intervals.setdefault(key, []), (start_time, end_time))
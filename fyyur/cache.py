@@ -0,0 +1,179 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, session, make_response
+
+
+#----------------------------------------------------------------------------#
+# Response cache.
+#----------------------------------------------------------------------------#
+
+# Rendered pages are cached per URL. Every cached page is tagged with what it
+# shows ('venues', 'venue:3', ...) and the current version of each tag is part
+# of the cache key, so invalidating a tag (bumping its version) makes every
+# page that depends on it miss on the next request; the stale entries simply
+# age out. This works the same for the in-process LRU and for Redis.
+#
+# The in-process backend is per worker: invalidate() only reaches the worker
+# that calls it. Pages under conditional_get() (fyyur/conditional.py) also
+# have their database version in the key, so writes from other workers or
+# from `flask import` change their keys everywhere; the other cached pages
+# (the home page) are served from each worker's copy until CACHE_TTL runs
+# out. Use the redis backend when that matters.
+
+
+class NullBackend(object):
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def get_versions(self, tags):
+        return [0] * len(tags)
+
+    def bump(self, tags):
+        pass
+
+
+class MemoryBackend(object):
+    # LRU with a per-entry TTL and a cap on the number of entries
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_versions(self, tags):
+        with self.lock:
+            return [self.versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+
+
+class RedisBackend(object):
+    # Any server speaking the Redis protocol; needs the optional redis package
+
+    def __init__(self, url, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + 'page:' + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + 'page:' + key, ttl, value)
+
+    def get_versions(self, tags):
+        if not tags:
+            return []
+        return [int(version or 0) for version in self.client.mget([self.prefix + 'tag:' + tag for tag in tags])]
+
+    def bump(self, tags):
+        pipeline = self.client.pipeline()
+        for tag in tags:
+            pipeline.incr(self.prefix + 'tag:' + tag)
+        pipeline.execute()
+
+
+class ResponseCache(object):
+    # Flask extension; the backend lives in app.extensions so every app built
+    # by create_app() gets its own
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        if backend == 'memory':
+            backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif backend == 'redis':
+            backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        elif backend in (None, 'null'):
+            backend = NullBackend()
+        else:
+            raise ValueError('Unknown CACHE_BACKEND: %s' % backend)
+        app.extensions['response_cache'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions['response_cache']
+
+    @property
+    def ttl(self):
+        return current_app.config.get('CACHE_TTL', 60)
+
+    def cached(self, tags=lambda **kwargs: []):
+        # tags is called with the view arguments and returns the tags of
+        # everything the page shows
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                # Pending flash messages are rendered into the page, so those
+                # responses are neither served from nor stored in the cache.
+                if request.method != 'GET' or '_flashes' in session:
+                    return view(**kwargs)
+
+                page_tags = tags(**kwargs)
+                try:
+                    versions = self.backend.get_versions(page_tags)
+                    key = request.full_path + '|' + ','.join(
+                        '%s@%d' % (tag, version) for tag, version in zip(page_tags, versions))
+                    if 'page_version' in g:
+                        key += '|' + g.page_version
+                    body = self.backend.get(key)
+                except Exception:
+                    current_app.logger.exception('Response cache lookup failed')
+                    return view(**kwargs)
+
+                if body is not None:
+                    response = make_response(body)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                body = view(**kwargs)
+                if not isinstance(body, str):
+                    return body
+                try:
+                    self.backend.set(key, body, self.ttl)
+                except Exception:
+                    current_app.logger.exception('Response cache store failed')
+                response = make_response(body)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags):
+        try:
+            self.backend.bump(tags)
+        except Exception:
+            current_app.logger.exception('Response cache invalidation failed')
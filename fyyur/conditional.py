@@ -0,0 +1,67 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import g, request, session, make_response
+
+
+#----------------------------------------------------------------------------#
+# Conditional GET.
+#----------------------------------------------------------------------------#
+
+# Views decorated with conditional_get() answer If-None-Match /
+# If-Modified-Since with 304 before rendering anything. The version function
+# receives the view arguments and returns a tuple of values that changes
+# whenever the page would (see the "Page versions" queries), or None to just
+# run the view (e.g. to let it 404). The ETag is a hash of that tuple and
+# Last-Modified the latest timestamp in it. The ETag is also left in
+# g.page_version for the response cache (fyyur/cache.py).
+
+
+def page_validators(version):
+    etag = hashlib.sha1(repr(version).encode('utf-8')).hexdigest()
+    timestamps = [value for value in version if isinstance(value, datetime)]
+    last_modified = None
+    if timestamps:
+        # Timestamps are stored as naive local time (datetime.now(), like the
+        # rest of the app); astimezone() applies the local offset for the
+        # UTC Last-Modified header
+        last_modified = max(timestamps).replace(microsecond=0).astimezone(timezone.utc)
+    return etag, last_modified
+
+
+def not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232)
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional_get(version_of):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            # Pages rendered with pending flash messages are not revalidated
+            if request.method != 'GET' or '_flashes' in session:
+                return view(**kwargs)
+
+            version = version_of(**kwargs)
+            if version is None:
+                return view(**kwargs)
+            etag, last_modified = page_validators(tuple(version))
+            g.page_version = etag
+
+            if not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from datetime import datetime
+import click
+from sqlalchemy import bindparam, func, select
+from fyyur import db
+from fyyur.models import Venue, Artist, Show
+
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# Venue and Artist carry upcoming_shows_count / past_shows_count so search
+# results and listings need no aggregation over show. Every show records
+# whether it is counted as upcoming (show.counted_upcoming); writes adjust
+# the counters incrementally and `flask counters rollover`, run periodically
+# (e.g. every minute from cron), moves shows that have started from upcoming
+# to past. Between two runs a show that just started is still counted as
+# upcoming. `flask counters rebuild` recomputes everything from scratch.
+#
+# The rollover flips counted_upcoming with UPDATE ... RETURNING, so every
+# show is moved exactly once even with writers or another rollover running
+# at the same time.
+#
+# Counter updates bump updated_at, as the pages showing the counts change,
+# but set profile_updated_at to itself: a booking does not make the venue or
+# artist stale for the match lists (fyyur/matching.py).
+
+
+def show_changes(shows, sign=1):
+    # shows: (venue_id, artist_id, counted_upcoming) tuples; returns
+    # {(model, id): [upcoming delta, past delta]}
+    changes = defaultdict(lambda: [0, 0])
+    for venue_id, artist_id, upcoming in shows:
+        index = 0 if upcoming else 1
+        changes[(Venue, int(venue_id))][index] += sign
+        changes[(Artist, int(artist_id))][index] += sign
+    return changes
+
+
+def adjust_counters(changes):
+    # One executemany UPDATE per table, relative to the stored values
+    for model in (Venue, Artist):
+        table = model.__table__
+        params = [{'counter_id': id, 'upcoming_delta': upcoming, 'past_delta': past}
+                  for (changed_model, id), (upcoming, past) in changes.items()
+                  if changed_model is model and (upcoming or past)]
+        if params:
+            db.session.execute(table.update().where(table.c.id == bindparam('counter_id')).values(
+                upcoming_shows_count=table.c.upcoming_shows_count + bindparam('upcoming_delta'),
+                past_shows_count=table.c.past_shows_count + bindparam('past_delta'),
+                profile_updated_at=table.c.profile_updated_at), params)
+
+
+def count_new_shows(shows, now=None):
+    # shows: Show objects or insert dicts not yet flushed; marks each as
+    # upcoming or past and counts it. Runs in the caller's transaction.
+    now = now or datetime.now()
+    counted = []
+    for show in shows:
+        if isinstance(show, dict):
+            show['counted_upcoming'] = show['start_time'] > now
+            counted.append((show['venue_id'], show['artist_id'], show['counted_upcoming']))
+        else:
+            show.counted_upcoming = show.start_time > now
+            counted.append((show.venue_id, show.artist_id, show.counted_upcoming))
+    adjust_counters(show_changes(counted))
+
+
+def uncount_shows(shows):
+    # Shows about to be deleted
+    adjust_counters(show_changes([(show.venue_id, show.artist_id, show.counted_upcoming) for show in shows], -1))
+
+
+def rollover(now=None):
+    # Returns the number of shows moved from upcoming to past
+    now = now or datetime.now()
+    table = Show.__table__
+    rows = db.session.execute(table.update()
+                              .where(table.c.counted_upcoming, table.c.start_time <= now)
+                              .values(counted_upcoming=False)
+                              .returning(table.c.venue_id, table.c.artist_id)).all()
+    changes = defaultdict(lambda: [0, 0])
+    for venue_id, artist_id in rows:
+        for key in ((Venue, venue_id), (Artist, artist_id)):
+            changes[key][0] -= 1
+            changes[key][1] += 1
+    adjust_counters(changes)
+    return len(rows)
+
+
+def rebuild(now=None):
+    now = now or datetime.now()
+    shows = Show.__table__
+    db.session.execute(shows.update().values(counted_upcoming=shows.c.start_time > now))
+    for model, show_fk in ((Venue, shows.c.venue_id), (Artist, shows.c.artist_id)):
+        table = model.__table__
+        upcoming = select(func.count(shows.c.id)).where(show_fk == table.c.id, shows.c.counted_upcoming)
+        past = select(func.count(shows.c.id)).where(show_fk == table.c.id, ~shows.c.counted_upcoming)
+        db.session.execute(table.update().values(upcoming_shows_count=upcoming.scalar_subquery(),
+                                                 past_shows_count=past.scalar_subquery(),
+                                                 profile_updated_at=table.c.profile_updated_at))
+
+
+@click.group('counters')
+def counters_command():
+    """Maintain the upcoming/past show counters."""
+
+
+@counters_command.command('rollover')
+def rollover_command():
+    """Move shows that have started from upcoming to past."""
+    count = rollover()
+    db.session.commit()
+    click.echo('%d shows rolled over' % count)
+
+
+@counters_command.command('rebuild')
+def rebuild_command():
+    """Recompute every counter from the show table."""
+    rebuild()
+    db.session.commit()
+    click.echo('counters rebuilt')
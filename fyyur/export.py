@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import click
+from datetime import datetime
+from flask import Response, stream_with_context
+from sqlalchemy.orm import selectinload
+from fyyur import db
+from fyyur.models import Venue, Artist, Show
+
+
+#----------------------------------------------------------------------------#
+# Bulk export.
+#----------------------------------------------------------------------------#
+
+# Venues, artists and shows are read in id order with yield_per, which on
+# PostgreSQL runs the query on a server-side cursor, and serialised row by row
+# into a generator, so memory use does not depend on the size of the table.
+# Genres are loaded per batch (selectinload works together with yield_per).
+# The CSV output uses the same comma separated genres as `flask import`.
+
+EXPORT_BATCH_SIZE = 1000
+
+VENUE_COLUMNS = ['id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'facebook_link', 'image_link',
+                 'website', 'seeking_talent', 'seeking_description', 'updated_at']
+ARTIST_COLUMNS = ['id', 'name', 'city', 'state', 'phone', 'genres', 'facebook_link', 'image_link',
+                  'website', 'seeking_venue', 'seeking_description', 'updated_at']
+SHOW_COLUMNS = ['id', 'venue_id', 'artist_id', 'start_time', 'end_time', 'updated_at']
+
+
+def entity_rows(model, columns):
+    query = db.session.query(model).options(selectinload(model.genres)).order_by(model.id) \
+        .yield_per(EXPORT_BATCH_SIZE)
+    for entity in query:
+        row = {column: getattr(entity, column) for column in columns if column != 'genres'}
+        row['genres'] = entity.genre_names()
+        yield row
+        # Nothing refers back to the rows once written; let them go
+        db.session.expunge(entity)
+
+
+def show_rows(columns):
+    query = db.session.query(*[getattr(Show, column) for column in columns]).order_by(Show.id) \
+        .yield_per(EXPORT_BATCH_SIZE)
+    for values in query:
+        yield dict(zip(columns, values))
+
+
+EXPORTS = {
+    'venues': (VENUE_COLUMNS, lambda: entity_rows(Venue, VENUE_COLUMNS)),
+    'artists': (ARTIST_COLUMNS, lambda: entity_rows(Artist, ARTIST_COLUMNS)),
+    'shows': (SHOW_COLUMNS, lambda: show_rows(SHOW_COLUMNS)),
+}
+
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def jsonl_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    return jsonl_value(value)
+
+
+def jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({column: jsonl_value(row[column]) for column in columns}) + '\n'
+
+
+def csv_lines(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in header_and_rows(columns, rows):
+        writer.writerow(values)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def header_and_rows(columns, rows):
+    yield columns
+    for row in rows:
+        yield [csv_value(row[column]) for column in columns]
+
+
+def export_lines(kind, format):
+    columns, rows = EXPORTS[kind]
+    lines = jsonl_lines if format == 'jsonl' else csv_lines
+    return lines(columns, rows())
+
+
+def export_response(kind, format):
+    # The request context (and with it the session) stays open until the
+    # generator is exhausted
+    response = Response(stream_with_context(export_lines(kind, format)), mimetype=CONTENT_TYPES[format])
+    response.headers['Content-Disposition'] = 'attachment; filename=%s.%s' % (kind, format)
+    return response
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', type=click.Choice(sorted(CONTENT_TYPES)), default='jsonl', show_default=True)
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-',
+              help='Output file (default: stdout).')
+def export_command(kind, format, output):
+    """Export all venues, artists or shows as JSONL or CSV."""
+    count = 0
+    for line in export_lines(kind, format):
+        output.write(line)
+        count += 1
+    if format == 'csv':
+        count -= 1
+    click.echo('%d %s exported' % (count, kind), err=True)
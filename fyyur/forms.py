@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, InputRequired, Email, Regexp, Optional
+from wtforms.validators import DataRequired, AnyOf, URL, InputRequired, Email, Regexp, Optional, ValidationError
+from fyyur.models import MAX_SHOW_DURATION
 
 
 state_choices = [
@@ -93,6 +94,19 @@ class ShowForm(FlaskForm):
         validators=[DataRequired("Need a show date & time")],
         default= datetime.today()
     )
+    # Optional; DEFAULT_SHOW_DURATION after start_time when left empty
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(self, field):
+        if field.data is None or self.start_time.data is None:
+            return
+        if field.data <= self.start_time.data:
+            raise ValidationError('End time must be after the start time')
+        if field.data - self.start_time.data > MAX_SHOW_DURATION:
+            raise ValidationError('A show can last at most %d hours' % (MAX_SHOW_DURATION.total_seconds() // 3600))
 
 
 class VenueForm(FlaskForm):
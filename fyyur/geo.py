@@ -0,0 +1,216 @@
+import csv
+import math
+from datetime import datetime
+import click
+from sqlalchemy import and_, or_, tuple_, bindparam
+from fyyur import db, cache
+from fyyur.models import Venue, Place
+
+
+#----------------------------------------------------------------------------#
+# Venue locations.
+#----------------------------------------------------------------------------#
+
+# Venues are geocoded offline from the place table: one row per (city,
+# state) with its centre, loaded with `flask geocode load FILE`. A venue
+# gets the coordinates of its city when it is created, edited or imported,
+# so locations are city-level, not street-level.
+#
+# Every located venue also stores the geohash of its coordinates. Geohashes
+# of nearby points share a prefix and every prefix is a lat/lng rectangle,
+# so a radius search looks up the few rectangles covering the circle as
+# ranges of the ordinary B-tree index on venue.geohash, then keeps the rows
+# whose exact distance is within the radius.
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# At most this many index ranges per search; fewer means larger cells
+MAX_CELLS = 16
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = 69.09
+LOOKUP_BATCH_SIZE = 500
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    point = (latitude, longitude)
+    chars, value, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude (even) and latitude (odd)
+        axis = 1 if even else 0
+        middle = sum(bounds[axis]) / 2
+        value <<= 1
+        if point[axis] >= middle:
+            value |= 1
+            bounds[axis][0] = middle
+        else:
+            bounds[axis][1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            value, bit = 0, 0
+    return ''.join(chars)
+
+
+def distance_miles(latitude1, longitude1, latitude2, longitude2):
+    # Haversine great-circle distance
+    lat1, lat2 = math.radians(latitude1), math.radians(latitude2)
+    dlat = lat2 - lat1
+    dlng = math.radians(longitude2 - longitude1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_size(precision):
+    # (height, width) in degrees of a geohash cell
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def covering_cells(latitude, longitude, radius):
+    # Geohash prefixes whose cells together cover the circle, as many as
+    # fit in MAX_CELLS at the finest precision that allows it
+    dlat = radius / MILES_PER_DEGREE
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    cos = math.cos(math.radians(max(abs(south), abs(north))))
+    dlng = 360.0 if cos < 1e-6 else min(360.0, radius / (MILES_PER_DEGREE * cos))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), min(int((north + 90) // height), int(180 / height) - 1) + 1)
+        columns_count = int(360 / width)
+        first, last = int((longitude - dlng + 180) // width), int((longitude + dlng + 180) // width)
+        # Wrap around the antimeridian
+        columns = range(columns_count) if last - first + 1 >= columns_count \
+            else [column % columns_count for column in range(first, last + 1)]
+        if len(rows) * len(columns) <= MAX_CELLS or precision == 1:
+            return sorted(encode_geohash(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+                          for row in rows for column in columns)
+
+
+def prefix_range(prefix):
+    # [low, high) of the geohashes starting with prefix; high is None past 'zzz...'
+    stripped = prefix.rstrip(BASE32[-1])
+    if not stripped:
+        return prefix, None
+    return prefix, stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+
+
+def within_cells(column, cells):
+    ranges = []
+    for cell in cells:
+        low, high = prefix_range(cell)
+        ranges.append(column >= low if high is None else and_(column >= low, column < high))
+    return or_(*ranges)
+
+
+def place_key(city):
+    return ' '.join(city.lower().split())
+
+
+def lookup_places(pairs):
+    # {(city key, state): (latitude, longitude)} for the (city, state) pairs found
+    keys = sorted({(place_key(city), state) for city, state in pairs})
+    found = {}
+    for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+        rows = db.session.query(Place.city, Place.state, Place.latitude, Place.longitude)\
+            .filter(tuple_(Place.city, Place.state).in_(keys[start:start + LOOKUP_BATCH_SIZE]))
+        for city, state, latitude, longitude in rows:
+            found[(city, state)] = (latitude, longitude)
+    return found
+
+
+def location_values(location):
+    # Column values for a (latitude, longitude) or None
+    if location is None:
+        return {'latitude': None, 'longitude': None, 'geohash': None}
+    latitude, longitude = location
+    return {'latitude': latitude, 'longitude': longitude, 'geohash': encode_geohash(latitude, longitude)}
+
+
+def locate(city, state):
+    # Centre of a city, or None when it is not in the place table
+    return lookup_places([(city, state)]).get((place_key(city), state))
+
+
+def locate_venue(venue):
+    for name, value in location_values(locate(venue.city, venue.state)).items():
+        setattr(venue, name, value)
+
+
+def venues_near(query, latitude, longitude, radius, limit):
+    # query selects Venue columns; returns [(distance, row)] of the nearest
+    # venues within radius miles, closest first
+    rows = query.add_columns(Venue.latitude, Venue.longitude)\
+        .filter(within_cells(Venue.geohash, covering_cells(latitude, longitude, radius)))
+    near = []
+    for row in rows:
+        distance = distance_miles(latitude, longitude, row[-2], row[-1])
+        if distance <= radius:
+            near.append((distance, row[:-2]))
+    near.sort(key=lambda item: (item[0], item[1][0]))
+    return near[:limit]
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('geocode')
+def geocode_command():
+    """Maintain the place table and venue locations."""
+
+
+@geocode_command.command('load')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+def load_command(file, batch_size):
+    """Load city centres from a CSV file with city,state,latitude,longitude columns.
+
+    Existing (city, state) rows are replaced. Run `flask geocode venues`
+    afterwards to locate the venues of new places.
+    """
+    places = {}
+    for row in csv.DictReader(file):
+        places[(place_key(row['city']), row['state'].strip())] = (float(row['latitude']), float(row['longitude']))
+    keys = list(places)
+    for start in range(0, len(keys), batch_size):
+        chunk = keys[start:start + batch_size]
+        db.session.query(Place).filter(tuple_(Place.city, Place.state).in_(chunk))\
+            .delete(synchronize_session=False)
+        db.session.execute(Place.__table__.insert(), [
+            {'city': city, 'state': state, 'latitude': places[(city, state)][0],
+             'longitude': places[(city, state)][1]} for city, state in chunk])
+        db.session.commit()
+    click.echo('%d places loaded' % len(keys))
+
+
+@geocode_command.command('venues')
+@click.option('--all', 'everything', is_flag=True, help='Also relocate venues that already have coordinates.')
+@click.option('--batch-size', default=1000, show_default=True, help='Venues per transaction.')
+def venues_command(everything, batch_size):
+    """Set venue coordinates from the place table."""
+    query = db.session.query(Venue.id, Venue.city, Venue.state).order_by(Venue.id)
+    if not everything:
+        query = query.filter(Venue.geohash.is_(None))
+    venues = query.all()
+    located = missing = 0
+    for start in range(0, len(venues), batch_size):
+        chunk = venues[start:start + batch_size]
+        places = lookup_places([(city, state) for _, city, state in chunk])
+        params = []
+        for id, city, state in chunk:
+            location = places.get((place_key(city), state))
+            if location is None:
+                missing += 1
+            else:
+                located += 1
+            params.append(dict(location_values(location), venue_id=id))
+        table = Venue.__table__
+        db.session.execute(table.update().where(table.c.id == bindparam('venue_id')).values(
+            latitude=bindparam('latitude'), longitude=bindparam('longitude'), geohash=bindparam('geohash'),
+            updated_at=datetime.now()), params)
+        db.session.commit()
+    cache.invalidate('venues')
+    click.echo('%d venues located, %d without a known place' % (located, missing))
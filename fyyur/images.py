@@ -0,0 +1,416 @@
+import hashlib
+import http.client
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from io import BytesIO
+from urllib.parse import urlsplit
+from flask import current_app, request, abort, make_response, url_for
+from PIL import Image, ImageOps
+
+
+#----------------------------------------------------------------------------#
+# Image proxy.
+#----------------------------------------------------------------------------#
+
+# Venue and artist pictures are served from /images/<kind>/<id>/<size> as
+# resized thumbnails instead of hot-linking image_link at full size. The
+# route only ever fetches the image_link stored for that venue or artist, so
+# it cannot be used to fetch arbitrary URLs.
+#
+# Each source image is fetched once and kept in a content-addressed disk
+# cache under IMAGE_CACHE_DIR:
+#   urls/<version>                   sha256 of the image fetched from a link
+#   sources/<sha256>                 the fetched bytes
+#   thumbs/<sha256>-<size>.<format>  thumbnails, WebP or JPEG
+# where version is a hash of the link. Templates put the version in the
+# thumbnail URL (thumbnail_url()), so a URL always names the same picture.
+# The view checks the version against the row's current image_link (one
+# primary key lookup) and only then answers from the disk with a one-year
+# immutable Cache-Control; other versions get the current picture with a
+# short max-age. Editing image_link changes the version and so the URL.
+#
+# Fetching and resizing run on a pool of IMAGE_WORKERS threads (Pillow
+# releases the GIL while decoding and encoding); concurrent requests for the
+# same thumbnail wait for one job. Hits refresh a file's mtime, and once the
+# cache grows past IMAGE_CACHE_MAX_BYTES the least recently used files are
+# deleted until it is back under EVICT_TO of that size. Every worker process
+# evicts on its own, from a scan of the directory.
+
+THUMBNAIL_SIZES = {'tile': (400, 400), 'page': (800, 800)}
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+QUALITY = 80
+VERSION_LENGTH = 16
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Responses whose URL does not carry the current version
+SHORT_MAX_AGE = 300
+# Links that could not be fetched or decoded are not retried for this long
+FAILURE_TTL = 300
+EVICT_TO = 0.9
+# Hits refresh the mtime at most this often
+TOUCH_INTERVAL = 3600
+
+
+def link_version(link):
+    return hashlib.sha256(link.encode('utf-8')).hexdigest()[:VERSION_LENGTH]
+
+
+def make_thumbnail(data, size, format):
+    try:
+        image = Image.open(BytesIO(data))
+        # JPEG sources are decoded at a reduced scale when they are much larger
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if format == 'jpeg' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        output = BytesIO()
+        image.save(output, FORMATS[format][0], quality=QUALITY)
+    except Image.DecompressionBombError as error:
+        raise ValueError(str(error))
+    return output.getvalue()
+
+
+#  Fetchers
+#  ----------------------------------------------------------------
+
+def public_address(host, port):
+    # An address of host to connect to; refused when any of its addresses
+    # is private, loopback or link-local
+    addresses = [info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+    for address in addresses:
+        if not ipaddress.ip_address(address.split('%')[0]).is_global:
+            raise ValueError('Refusing to fetch from %s: it resolves to a non-public address' % host)
+    return addresses[0]
+
+
+# The connections resolve and check the host themselves and connect to the
+# address they checked, so a DNS answer cannot change between the check and
+# the connection. Host header and TLS SNI/certificate checks still use the
+# host name.
+
+class PinnedHTTPConnection(http.client.HTTPConnection):
+
+    def connect(self):
+        self.sock = socket.create_connection((public_address(self.host, self.port), self.port),
+                                             self.timeout, self.source_address)
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+
+    def connect(self):
+        sock = socket.create_connection((public_address(self.host, self.port), self.port),
+                                        self.timeout, self.source_address)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+class PinnedHTTPHandler(urllib.request.HTTPHandler):
+
+    def http_open(self, request):
+        return self.do_open(PinnedHTTPConnection, request)
+
+
+class PinnedHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def https_open(self, request):
+        return self.do_open(PinnedHTTPSConnection, request)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # Redirects may only lead to other http(s) URLs, which go through the
+    # pinned connections again
+
+    def redirect_request(self, request, fp, code, message, headers, url):
+        check_link(url)
+        return super(CheckedRedirectHandler, self).redirect_request(request, fp, code, message, headers, url)
+
+
+def check_link(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Not an http(s) link: %s' % url)
+
+
+class HTTPFetcher(object):
+    # Fetches http(s) links, following redirects, from public addresses
+    # only. The opener has no proxy, ftp or file handlers.
+
+    def __init__(self, timeout=10, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.opener = urllib.request.OpenerDirector()
+        for handler in (PinnedHTTPHandler(), PinnedHTTPSHandler(), CheckedRedirectHandler(),
+                        urllib.request.HTTPDefaultErrorHandler(), urllib.request.HTTPErrorProcessor()):
+            self.opener.add_handler(handler)
+
+    def fetch(self, url):
+        check_link(url)
+        request = urllib.request.Request(url, headers={'User-Agent': 'fyyur-image-proxy'})
+        # A cut-short body (IncompleteRead) or a garbled reply (BadStatusLine)
+        # is an http.client.HTTPException, not an OSError: callers only
+        # expect OSError/ValueError. read(n) returns a body cut short before
+        # its Content-Length without raising, so that is checked here.
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                data = response.read(self.max_bytes + 1)
+                if response.length and len(data) <= self.max_bytes:
+                    raise http.client.IncompleteRead(data, response.length)
+        except http.client.HTTPException as error:
+            raise OSError('Could not fetch %s: %r' % (url, error))
+        if len(data) > self.max_bytes:
+            raise ValueError('%s is larger than %d bytes' % (url, self.max_bytes))
+        return data
+
+
+class FileFetcher(object):
+    # Stand-in for development and benchmarks: http://host/path is read from
+    # <root>/host/path
+
+    def __init__(self, root, max_bytes=10 * 1024 * 1024):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+
+    def fetch(self, url):
+        parts = urlsplit(url)
+        path = os.path.normpath(os.path.join(self.root, parts.hostname or '', parts.path.lstrip('/')))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError('%s is outside the image root' % url)
+        with open(path, 'rb') as file:
+            data = file.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise ValueError('%s is larger than %d bytes' % (url, self.max_bytes))
+        return data
+
+
+#  Disk cache
+#  ----------------------------------------------------------------
+
+class ThumbnailCache(object):
+
+    def __init__(self, root, max_bytes, fetcher, workers=4):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='fyyur-images')
+        self.jobs = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+        # Estimated size on disk; None until the first scan
+        self.size = None
+        self.evicting = threading.Lock()
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def thumb_path(self, digest, size, format):
+        return self.path('thumbs', digest[:2], '%s-%s.%s' % (digest, size, format))
+
+    def read(self, path):
+        # Contents of a cache file or None; hits refresh its mtime
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+                modified = os.fstat(file.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return data
+
+    def write(self, path, data):
+        # Atomic, so other threads and workers never read a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        with self.lock:
+            if self.size is not None:
+                self.size += len(data)
+            if self.size is not None and self.size <= self.max_bytes:
+                return
+        self.evict()
+
+    def digest_of(self, version):
+        data = self.read(self.path('urls', version[:2], version))
+        return data.decode('ascii') if data else None
+
+    def cached(self, version, size, format):
+        # Thumbnail of a link by its version, without the link itself
+        digest = self.digest_of(version)
+        if digest is None:
+            return None
+        return self.read(self.thumb_path(digest, size, format))
+
+    def source(self, link):
+        # (sha256, bytes) of the link's image, fetched unless it is cached
+        version = link_version(link)
+        digest = self.digest_of(version)
+        if digest is not None:
+            data = self.read(self.path('sources', digest[:2], digest))
+            if data is not None:
+                return digest, data
+        data = self.fetcher.fetch(link)
+        digest = hashlib.sha256(data).hexdigest()
+        self.write(self.path('sources', digest[:2], digest), data)
+        self.write(self.path('urls', version[:2], version), digest.encode('ascii'))
+        return digest, data
+
+    def build(self, link, size, format):
+        digest, data = self.source(link)
+        path = self.thumb_path(digest, size, format)
+        thumbnail = self.read(path)
+        if thumbnail is None:
+            thumbnail = make_thumbnail(data, THUMBNAIL_SIZES[size], format)
+            self.write(path, thumbnail)
+        return digest, thumbnail
+
+    def thumbnail(self, link, size, format, timeout=30):
+        # (sha256 of the source, thumbnail bytes); raises OSError or
+        # ValueError when the link cannot be fetched or decoded
+        key = (link, size, format)
+        with self.lock:
+            failed_until = self.failures.get(link)
+            if failed_until is not None and failed_until > time.monotonic():
+                raise ValueError('%s failed recently' % link)
+            job = self.jobs.get(key)
+            started = job is None
+            if started:
+                job = self.jobs[key] = self.executor.submit(self.build, link, size, format)
+        if started:
+            # Outside the lock: the callback runs right away if the job is done
+            job.add_done_callback(lambda _: self.finish(key))
+        try:
+            return job.result(timeout)
+        except FutureTimeout:
+            raise OSError('Timed out building the thumbnail of %s' % link)
+        except (OSError, ValueError):
+            now = time.monotonic()
+            with self.lock:
+                self.failures = dict((failed, until) for failed, until in self.failures.items() if until > now)
+                self.failures[link] = now + FAILURE_TTL
+            raise
+
+    def finish(self, key):
+        with self.lock:
+            self.jobs.pop(key, None)
+
+    def evict(self):
+        # Least recently used first, from a scan of the whole cache
+        if not self.evicting.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    if name.startswith('.tmp-'):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            if total > self.max_bytes:
+                files.sort()
+                for _, size, path in files:
+                    if total <= self.max_bytes * EVICT_TO:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            with self.lock:
+                self.size = total
+        finally:
+            self.evicting.release()
+
+
+#  Extension
+#  ----------------------------------------------------------------
+
+class ImageProxy(object):
+    # Flask extension; the cache lives in app.extensions so every app built
+    # by create_app() gets its own
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from fyyur.models import Venue, Artist
+        self.models = {'venue': Venue, 'artist': Artist}
+        if not app.config.get('IMAGE_PROXY', True):
+            app.add_template_global(lambda kind, id, link, size='tile': link, 'thumbnail_url')
+            return
+        fetcher = app.config.get('IMAGE_FETCHER', 'http')
+        max_bytes = app.config.get('IMAGE_MAX_SOURCE_BYTES', 10 * 1024 * 1024)
+        if fetcher == 'http':
+            fetcher = HTTPFetcher(app.config.get('IMAGE_FETCH_TIMEOUT', 10), max_bytes)
+        elif fetcher == 'file':
+            fetcher = FileFetcher(app.config['IMAGE_FILE_ROOT'], max_bytes)
+        else:
+            raise ValueError('Unknown IMAGE_FETCHER: %s' % fetcher)
+        app.extensions['image_proxy'] = ThumbnailCache(app.config['IMAGE_CACHE_DIR'],
+                                                       app.config.get('IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024),
+                                                       fetcher, app.config.get('IMAGE_WORKERS', 4))
+        app.add_url_rule('/images/<kind>/<int:id>/<size>', 'thumbnail', self.view)
+        app.add_template_global(self.thumbnail_url, 'thumbnail_url')
+
+    @property
+    def cache(self):
+        return current_app.extensions['image_proxy']
+
+    def thumbnail_url(self, kind, id, link, size='tile'):
+        # Proxied thumbnail of a venue/artist image_link; other links
+        # (empty, relative) are returned as they are
+        if not link or not link.startswith(('http://', 'https://')):
+            return link
+        return url_for('thumbnail', kind=kind, id=id, size=size, v=link_version(link))
+
+    def view(self, kind, id, size):
+        if kind not in self.models or size not in THUMBNAIL_SIZES:
+            abort(404)
+        # Browsers that can show WebP say so explicitly; */* does not count
+        format = 'webp' if 'image/webp' in request.accept_mimetypes.values() else 'jpeg'
+        model = self.models[kind]
+        link = model.query.with_entities(model.image_link).filter(model.id == id).scalar()
+        if not link:
+            abort(404)
+        # Only the version of this row's link names an immutable picture
+        current = request.args.get('v') == link_version(link)
+        thumbnail = self.cache.cached(link_version(link), size, format) if current else None
+        if thumbnail is None:
+            try:
+                _, thumbnail = self.cache.thumbnail(link, size, format)
+            except (OSError, ValueError) as error:
+                current_app.logger.warning('Could not make a thumbnail of %s: %s', link, error)
+                abort(404)
+
+        response = make_response(thumbnail)
+        response.mimetype = FORMATS[format][1]
+        response.vary.add('Accept')
+        response.cache_control.public = True
+        if current:
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.max_age = SHORT_MAX_AGE
+        response.set_etag(hashlib.sha1(thumbnail).hexdigest())
+        return response.make_conditional(request)
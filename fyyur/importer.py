@@ -0,0 +1,297 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+import click
+from werkzeug.datastructures import MultiDict
+from fyyur import db, cache
+from fyyur.models import Venue, Artist, Show, Genre, DEFAULT_SHOW_DURATION, venue_genres, artist_genres
+from fyyur.forms import VenueForm, ArtistForm, ShowForm
+from fyyur.counters import count_new_shows
+from fyyur.geo import lookup_places, location_values, place_key
+from fyyur.bookings import lock_bookings, overlapping_shows, conflict_messages, BookingIndex
+
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# `flask import venues|artists|shows FILE` streams a CSV or JSONL file,
+# validates every row with the same form the create pages use and inserts
+# the valid ones in chunks: one executemany per table and one transaction
+# per chunk, so memory stays flat and a bad chunk only loses itself.
+#
+# Columns are the form field names (genres separated by commas in CSV, a list
+# in JSONL). Rejected rows are reported on stderr as FILE:LINE: errors.
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(stream):
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as error:
+            yield line_no, error
+
+
+def read_rows(stream, format):
+    return read_jsonl(stream) if format == 'jsonl' else read_csv(stream)
+
+
+def form_data(row):
+    # Build the MultiDict a browser would have posted for this row
+    data = MultiDict()
+    for key, value in row.items():
+        if value is None or key is None:
+            continue
+        if key == 'genres':
+            if isinstance(value, str):
+                value = [genre.strip() for genre in value.split(',') if genre.strip()]
+            for genre in value:
+                data.add(key, genre)
+        elif key.startswith('seeking_') and key != 'seeking_description':
+            # BooleanField treats any non-empty value as checked
+            if str(value).strip().lower() in TRUE_VALUES:
+                data.add(key, 'y')
+        else:
+            data.add(key, str(value))
+    return data
+
+
+def validate(form_class, row):
+    # Returns (form, None) or (None, error message)
+    if isinstance(row, Exception):
+        return None, 'invalid JSON: %s' % row
+    if not isinstance(row, dict):
+        return None, 'expected an object per line'
+    form = form_class(formdata=form_data(row), meta={'csrf': False})
+    if not form.validate():
+        return None, '; '.join('%s: %s' % (field, ', '.join(errors)) for field, errors in form.errors.items())
+    return form, None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class GenreIds(object):
+    # name -> genre.id for the whole import, creating unknown genres on the fly
+
+    def __init__(self):
+        self.ids = dict(db.session.query(Genre.name, Genre.id))
+
+    def get(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.ids]
+        if missing:
+            db.session.execute(Genre.__table__.insert(), [{'name': name} for name in missing])
+            self.ids.update(db.session.query(Genre.name, Genre.id).filter(Genre.name.in_(missing)))
+        return [self.ids[name] for name in dict.fromkeys(names)]
+
+
+class EntityImporter(object):
+    # Venues and artists: entity rows plus their genre links
+
+    def __init__(self, model, form_class, link_table, link_column, tag):
+        self.model = model
+        self.form_class = form_class
+        self.link_table = link_table
+        self.link_column = link_column
+        self.tag = tag
+        self.genre_ids = None
+
+    def values(self, form):
+        values = {
+            'name': form.name.data,
+            'city': form.city.data,
+            'state': form.state.data,
+            'phone': form.phone.data,
+            'facebook_link': form.facebook_link.data or '',
+            'image_link': form.image_link.data,
+            'website': form.website_link.data,
+            'seeking_description': form.seeking_description.data,
+        }
+        if self.model is Venue:
+            values['address'] = form.address.data
+            values['seeking_talent'] = form.seeking_talent.data
+        else:
+            values['seeking_venue'] = form.seeking_venue.data
+        return values
+
+    def check(self, rows):
+        return rows
+
+    def reset(self):
+        # Genres created in a rolled back chunk are gone too
+        self.genre_ids = None
+
+    def insert(self, rows):
+        if self.genre_ids is None:
+            self.genre_ids = GenreIds()
+        table = self.model.__table__
+        values = [self.values(form) for _, form in rows]
+        if self.model is Venue:
+            places = lookup_places([(row['city'], row['state']) for row in values])
+            for row in values:
+                row.update(location_values(places.get((place_key(row['city']), row['state']))))
+        ids = db.session.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True),
+                                 values).scalars().all()
+        links = [{self.link_column: id, 'genre_id': genre_id}
+                 for id, (_, form) in zip(ids, rows) for genre_id in self.genre_ids.get(form.genres.data)]
+        if links:
+            db.session.execute(self.link_table.insert(), links)
+
+    def tags(self):
+        return [self.tag]
+
+
+class ShowImporter(object):
+    form_class = ShowForm
+
+    def __init__(self):
+        self.venue_ids = set()
+        self.artist_ids = set()
+
+    def check(self, rows):
+        # ShowForm only checks that the ids are present; reject rows whose
+        # venue or artist does not exist, or that double-book either of
+        # them, instead of failing the whole chunk
+        checked = []
+        for line_no, form in rows:
+            try:
+                form.venue_id.data, form.artist_id.data = int(form.venue_id.data), int(form.artist_id.data)
+            except ValueError:
+                checked.append((line_no, 'venue_id and artist_id must be integers'))
+                continue
+            checked.append((line_no, form))
+        forms = [form for _, form in checked if not isinstance(form, str)]
+        # Locked until the chunk is committed (see fyyur/bookings.py)
+        venues, artists = lock_bookings([form.venue_id.data for form in forms],
+                                        [form.artist_id.data for form in forms])
+        # Overlaps with stored shows and with earlier rows of this chunk
+        booked = BookingIndex()
+        result = []
+        for line_no, form in checked:
+            if isinstance(form, str):
+                result.append((line_no, form))
+                continue
+            venue_id, artist_id, start_time = form.venue_id.data, form.artist_id.data, form.start_time.data
+            form.end_time.data = end_time = form.end_time.data or start_time + DEFAULT_SHOW_DURATION
+            if venue_id not in venues:
+                result.append((line_no, 'venue_id: no venue %d' % venue_id))
+            elif artist_id not in artists:
+                result.append((line_no, 'artist_id: no artist %d' % artist_id))
+            else:
+                conflicts = ['%s %d is already booked from %s to %s in this file' % ((kind, id) + interval)
+                             for kind, id in (('venue', venue_id), ('artist', artist_id))
+                             for interval in [booked.overlaps((kind, id), start_time, end_time)] if interval]
+                conflicts = conflicts or conflict_messages(
+                    venue_id, artist_id, overlapping_shows(venue_id, artist_id, start_time, end_time))
+                if conflicts:
+                    result.append((line_no, '; '.join(conflicts)))
+                else:
+                    booked.add(('venue', venue_id), start_time, end_time)
+                    booked.add(('artist', artist_id), start_time, end_time)
+                    result.append((line_no, form))
+        return result
+
+    def reset(self):
+        pass
+
+    def insert(self, rows):
+        shows = [{'venue_id': form.venue_id.data, 'artist_id': form.artist_id.data, 'start_time': form.start_time.data,
+                  'end_time': form.end_time.data} for _, form in rows]
+        count_new_shows(shows)
+        db.session.execute(Show.__table__.insert(), shows)
+        self.venue_ids.update(form.venue_id.data for _, form in rows)
+        self.artist_ids.update(form.artist_id.data for _, form in rows)
+
+    def tags(self):
+        return ['shows'] + ['venue:%s' % id for id in self.venue_ids] + ['artist:%s' % id for id in self.artist_ids]
+
+
+IMPORTERS = {
+    'venues': lambda: EntityImporter(Venue, VenueForm, venue_genres, 'venue_id', 'venues'),
+    'artists': lambda: EntityImporter(Artist, ArtistForm, artist_genres, 'artist_id', 'artists'),
+    'shows': ShowImporter,
+}
+
+
+def run_import(kind, stream, format='csv', batch_size=1000, name='-', errors=sys.stderr):
+    # Returns a dict of counters; rejected rows are written to errors
+    importer = IMPORTERS[kind]()
+    stats = {'read': 0, 'imported': 0, 'rejected': 0, 'chunks': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+
+    def reject(line_no, message):
+        stats['rejected'] += 1
+        errors.write('%s:%d: %s\n' % (name, line_no, message))
+
+    for chunk in chunked(read_rows(stream, format), batch_size):
+        stats['read'] += len(chunk)
+        valid = []
+        for line_no, row in chunk:
+            form, message = validate(importer.form_class, row)
+            if form is None:
+                reject(line_no, message)
+            else:
+                valid.append((line_no, form))
+        valid = importer.check(valid) if valid else []
+        for line_no, form in [(line_no, form) for line_no, form in valid if isinstance(form, str)]:
+            reject(line_no, form)
+        valid = [(line_no, form) for line_no, form in valid if not isinstance(form, str)]
+        if not valid:
+            # Ends the transaction of the checks, releasing lock_bookings' row locks
+            db.session.rollback()
+            continue
+        try:
+            importer.insert(valid)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            importer.reset()
+            message = 'chunk failed: %s' % str(error).splitlines()[0]
+            for line_no, _ in valid:
+                reject(line_no, message)
+            continue
+        stats['imported'] += len(valid)
+        stats['chunks'] += 1
+
+    stats['seconds'] = time.perf_counter() - start
+    if stats['imported']:
+        # Only reaches a shared (redis) cache; web workers with the memory
+        # backend see the new rows through the page versions in their keys
+        cache.invalidate(*importer.tags())
+    return stats
+
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']),
+              help='File format; guessed from the extension when omitted.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per transaction.')
+def import_command(kind, file, format, batch_size):
+    """Bulk import venues, artists or shows from a CSV or JSONL file."""
+    if format is None:
+        format = 'jsonl' if file.name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    stats = run_import(kind, file, format, batch_size, name=file.name)
+    rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+    click.echo('%d rows read, %d imported, %d rejected in %d chunks, %.2fs (%.0f rows/s)'
+               % (stats['read'], stats['imported'], stats['rejected'], stats['chunks'], stats['seconds'], rate))
+    if stats['rejected']:
+        sys.exit(1)
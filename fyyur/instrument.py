@@ -0,0 +1,129 @@
+import re
+import time
+from collections import Counter
+from flask import g, current_app, request, has_request_context
+from markupsafe import escape
+from sqlalchemy import event
+
+
+#----------------------------------------------------------------------------#
+# SQL instrumentation.
+#----------------------------------------------------------------------------#
+
+# Engine events time every statement a request issues; request hooks add the
+# totals to the response as a Server-Timing header ("db" and "app") and log a
+# warning when a request runs more than SQL_WARN_STATEMENTS statements,
+# spends more than SQL_WARN_DB_MS in the database, or runs the same statement
+# SQL_WARN_REPEATS times or more (the N+1 pattern: one statement per row of
+# an earlier result). Statements are grouped by fingerprint: whitespace
+# collapsed, literals and expanded IN lists replaced by a placeholder.
+#
+# With SQL_DEBUG_PANEL on, HTML pages also get a table of their statements
+# appended to the body.
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))+\s*\)')
+PARAMETER = re.compile(r'%\(\w+\)s|:\w+|\?')
+
+
+def fingerprint(statement):
+    statement = ' '.join(statement.split())
+    statement = IN_LIST.sub('(?)', statement)
+    statement = PARAMETER.sub('?', statement)
+    return LITERALS.sub('?', statement)
+
+
+class RequestStats(object):
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.statements = []
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.db_time += elapsed
+        self.fingerprints[fingerprint(statement)] += 1
+        self.statements.append((statement, elapsed))
+
+    def repeated(self, threshold):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+# The start time is kept on the statement's execution context rather than
+# the connection: a statement that raises never reaches after_cursor_execute,
+# and its start time simply goes away with its context.
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.query_started_at = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = getattr(context, 'query_started_at', None)
+    if started_at is None:
+        return
+    if has_request_context() and 'sql_stats' in g:
+        g.sql_stats.record(statement, time.perf_counter() - started_at)
+
+
+def debug_panel(stats):
+    rows = ''.join('<tr><td>%.2f</td><td><code>%s</code></td></tr>' % (elapsed * 1000, escape(statement))
+                   for statement, elapsed in stats.statements)
+    return ('<div id="sql-debug-panel" class="container"><h4>%d SQL statements, %.1f ms</h4>'
+            '<table class="table table-condensed"><tr><th>ms</th><th>statement</th></tr>%s</table></div>'
+            % (stats.count, stats.db_time * 1000, rows))
+
+
+class SQLInstrumentation(object):
+    # Flask extension; hooks the engines of the given Flask-SQLAlchemy
+    # instance and the request cycle of the app
+
+    def __init__(self, db, app=None):
+        self.db = db
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('SQL_INSTRUMENTATION', True):
+            return
+        with app.app_context():
+            for engine in self.db.engines.values():
+                self.instrument(engine)
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def instrument(self, engine):
+        # Also used for engines created outside Flask-SQLAlchemy (fyyur/asgi.py)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    def start(self):
+        g.sql_stats = RequestStats()
+
+    def finish(self, response):
+        stats = g.pop('sql_stats', None)
+        if stats is None:
+            return response
+        config = current_app.config
+        total = time.perf_counter() - stats.started_at
+        response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d statements"' % (stats.db_time * 1000, stats.count))
+        response.headers.add('Server-Timing', 'app;dur=%.1f' % (total * 1000))
+
+        repeated = stats.repeated(config.get('SQL_WARN_REPEATS', 5))
+        if (stats.count > config.get('SQL_WARN_STATEMENTS', 20)
+                or stats.db_time * 1000 > config.get('SQL_WARN_DB_MS', 200)
+                or repeated):
+            current_app.logger.warning(
+                '%s %s: %d SQL statements, %.1f ms in the database%s',
+                request.method, request.full_path, stats.count, stats.db_time * 1000,
+                ''.join('\n  %dx %s' % (count, sql) for sql, count in repeated))
+
+        if config.get('SQL_DEBUG_PANEL') and response.mimetype == 'text/html' \
+                and not response.is_streamed and response.status_code == 200:
+            body = response.get_data(as_text=True)
+            if '</body>' in body:
+                response.set_data(body.replace('</body>', debug_panel(stats) + '</body>', 1))
+        return response
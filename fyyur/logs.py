@@ -0,0 +1,148 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+
+
+#----------------------------------------------------------------------------#
+# Logging.
+#----------------------------------------------------------------------------#
+
+# Handlers never write from the request thread: records are put on an
+# in-memory queue by a QueueHandler on the root logger and written by a
+# QueueListener thread, so a slow stderr or disk does not stall requests.
+# Records are tagged with the request id (X-Request-ID from the client or a
+# fresh one, echoed on the response) and written as one JSON object per line
+# (LOG_FORMAT=text for development) to stderr and, if set, LOG_FILE.
+#
+# LOG_LEVEL is the root level, LOG_LEVELS overrides it per logger
+# ("fyyur.routes=DEBUG,sqlalchemy.engine=INFO") and LOG_DEBUG_SAMPLE_RATE
+# keeps only that fraction of DEBUG records.
+
+RECORD_FIELDS = ('method', 'path', 'request_id')
+
+_listener = None
+
+
+class RequestFilter(logging.Filter):
+    # Adds the request id, method and path of the current request, if any
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class DebugSampler(logging.Filter):
+
+    def __init__(self, rate):
+        super(DebugSampler, self).__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in RECORD_FIELDS:
+            if getattr(record, field, None) is not None:
+                data[field] = getattr(record, field)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class TextFormatter(logging.Formatter):
+
+    def __init__(self):
+        super(TextFormatter, self).__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super(TextFormatter, self).format(record)
+        if getattr(record, 'request_id', None):
+            line += ' [%s %s %s]' % (record.method, record.path, record.request_id)
+        return line
+
+
+class LogQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        # Render the message and traceback in the calling thread (the
+        # arguments may change or the frames go away before the listener
+        # gets to it) but leave the formatting to the listener's handler
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def parse_levels(value):
+    # "a=DEBUG,b.c=WARNING" -> {'a': 'DEBUG', 'b.c': 'WARNING'}
+    levels = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(app):
+    # The root logger is process wide: only the first app sets it up
+    global _listener
+    config = app.config
+    if _listener is None:
+        formatter = TextFormatter() if config.get('LOG_FORMAT') == 'text' else JSONFormatter()
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if config.get('LOG_FILE'):
+            handlers.append(logging.FileHandler(config['LOG_FILE']))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        queue_handler = LogQueueHandler(log_queue)
+        queue_handler.addFilter(RequestFilter())
+        queue_handler.addFilter(DebugSampler(config.get('LOG_DEBUG_SAMPLE_RATE', 1.0)))
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(queue_handler)
+        root.setLevel(config.get('LOG_LEVEL', 'INFO'))
+        for name, level in parse_levels(config.get('LOG_LEVELS')).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    app.before_request(assign_request_id)
+    app.after_request(echo_request_id)
+
+
+def assign_request_id():
+    g.request_id = request.headers.get('X-Request-ID', '')[:128] or uuid.uuid4().hex
+
+
+def echo_request_id(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
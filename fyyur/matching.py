@@ -0,0 +1,353 @@
+from datetime import datetime
+import click
+import numpy as np
+from sqlalchemy import bindparam, func, or_, select
+from fyyur import db
+from fyyur.models import Venue, Artist, Genre, venue_genres, artist_genres, artist_matches, venue_matches
+from fyyur.geo import lookup_places, place_key, EARTH_RADIUS_MILES
+
+
+#----------------------------------------------------------------------------#
+# Matchmaking.
+#----------------------------------------------------------------------------#
+
+# Every artist seeking a venue is scored against every venue seeking talent:
+#
+#     score = GENRE_WEIGHT * genre similarity + LOCATION_WEIGHT * location
+#
+# Genre similarity is the Jaccard index of the two genre sets. Location is 1
+# in the same city, otherwise the larger of SAME_STATE_SCORE (same state)
+# and a proximity falling linearly to 0 at NEARBY_MILES between the city
+# centres of fyyur/geo.py.
+#
+# Genre sets are bit vectors (a uint64 word per 64 genre ids) and locations
+# unit vectors on the sphere, so a block of artists x venues is scored with
+# a few NumPy operations on whole arrays: AND + popcount for the genres and
+# a matrix product for the distances. A block holds about BLOCK_CELLS scores
+# whatever the sizes; the TOP_K best per artist and per venue are kept as the
+# blocks go and stored in artist_match and venue_match.
+#
+# `flask matches rebuild` recomputes every list. `flask matches refresh`,
+# run periodically like the counters rollover, only handles what changed
+# since: an artist or venue whose profile_updated_at is past its matched_at
+# (new or edited; show bookings and the counters leave it alone) gets its
+# list recomputed, so do the lists it was on, and the other lists take it in
+# where it now beats their last entry.
+
+TOP_K = 20
+GENRE_WEIGHT = 0.6
+LOCATION_WEIGHT = 0.4
+SAME_STATE_SCORE = 0.5
+NEARBY_MILES = 100.0
+BLOCK_CELLS = 1 << 22
+BATCH_SIZE = 5000
+
+
+class Side(object):
+    # Artists or venues: who is seeking, their genres and their match lists
+
+    def __init__(self, model, seeking, genre_table, genre_fk, matches, owner, candidate):
+        self.model = model
+        self.seeking = seeking
+        self.genre_table = genre_table
+        self.genre_fk = genre_fk
+        self.matches = matches
+        self.owner = matches.c[owner]
+        self.candidate = matches.c[candidate]
+
+
+ARTISTS = Side(Artist, Artist.seeking_venue, artist_genres, artist_genres.c.artist_id,
+               artist_matches, 'artist_id', 'venue_id')
+VENUES = Side(Venue, Venue.seeking_talent, venue_genres, venue_genres.c.venue_id,
+              venue_matches, 'venue_id', 'artist_id')
+
+
+class Features(object):
+    # The seeking entities of one side as arrays; row i describes ids[i]
+
+    def __init__(self, ids, bits, cities, states, xyz):
+        self.ids = ids
+        self.bits = bits
+        self.genre_counts = np.bitwise_count(bits).sum(axis=1, dtype=np.int32)
+        self.cities = cities
+        self.states = states
+        self.xyz = xyz
+
+    def __len__(self):
+        return len(self.ids)
+
+    def take(self, index):
+        return Features(self.ids[index], self.bits[index], self.cities[index], self.states[index], self.xyz[index])
+
+
+def unit_vectors(latitudes, longitudes):
+    # Points on the unit sphere. Unknown locations (NaN) become the zero
+    # vector, which is sqrt(2) away from everything, i.e. never nearby.
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    xyz = np.stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes),
+                    np.sin(latitudes)], axis=1)
+    return np.nan_to_num(xyz, nan=0.0).astype(np.float32)
+
+
+def genre_words():
+    return (db.session.query(func.max(Genre.id)).scalar() or 0) // 64 + 1
+
+
+def load_features(side, city_codes, state_codes, words):
+    # city_codes and state_codes are shared by both sides so codes compare
+    model = side.model
+    if model is Venue:
+        rows = db.session.query(Venue.id, Venue.city, Venue.state, Venue.latitude, Venue.longitude)
+    else:
+        rows = db.session.query(Artist.id, Artist.city, Artist.state)
+    rows = rows.filter(side.seeking.is_(True)).order_by(model.id).all()
+    if model is Venue:
+        locations = [(row[3], row[4]) if row[3] is not None else (np.nan, np.nan) for row in rows]
+    else:
+        places = lookup_places([(city, state) for _, city, state in rows])
+        locations = [places.get((place_key(city), state), (np.nan, np.nan)) for _, city, state in rows]
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    cities = np.array([city_codes.setdefault((place_key(row[1]), row[2]), len(city_codes)) for row in rows],
+                      dtype=np.int64)
+    states = np.array([state_codes.setdefault(row[2], len(state_codes)) for row in rows], dtype=np.int64)
+    locations = np.array(locations, dtype=np.float64).reshape(-1, 2)
+
+    # One bit per genre id; links of entities that are not seeking are dropped
+    bits = np.zeros((len(ids), words), dtype=np.uint64)
+    links = np.array(db.session.query(side.genre_fk, side.genre_table.c.genre_id).all(),
+                     dtype=np.int64).reshape(-1, 2)
+    positions = np.minimum(np.searchsorted(ids, links[:, 0]), max(len(ids) - 1, 0))
+    known = (ids[positions] == links[:, 0]) if len(ids) else np.zeros(len(links), dtype=bool)
+    genre_ids = links[known, 1]
+    np.bitwise_or.at(bits, (positions[known], genre_ids // 64),
+                     np.left_shift(np.uint64(1), (genre_ids % 64).astype(np.uint64)))
+    return Features(ids, bits, cities, states, unit_vectors(locations[:, 0], locations[:, 1]))
+
+
+def score_block(rows, columns):
+    # (len(rows), len(columns)) float32 scores, computed in place to keep
+    # the number of temporary arrays down
+    shared = np.bitwise_count(rows.bits[:, 0, None] & columns.bits[None, :, 0])
+    for word in range(1, rows.bits.shape[1]):
+        shared += np.bitwise_count(rows.bits[:, word, None] & columns.bits[None, :, word])
+    scores = shared.astype(np.float32)
+    union = np.add.outer(rows.genre_counts, columns.genre_counts).astype(np.float32)
+    union -= scores
+    np.maximum(union, 1.0, out=union)
+    scores /= union
+    scores *= GENRE_WEIGHT
+
+    # The chord between two unit vectors is the great-circle distance to
+    # within a fraction of a percent at the ranges that score; float32
+    # keeps it to about a mile
+    location = rows.xyz @ columns.xyz.T
+    location *= -2.0
+    location += 2.0
+    np.maximum(location, 0.0, out=location)
+    np.sqrt(location, out=location)
+    location *= -(EARTH_RADIUS_MILES / NEARBY_MILES)
+    location += 1.0
+    np.clip(location, 0.0, 1.0, out=location)
+    np.maximum(location, SAME_STATE_SCORE, out=location, where=rows.states[:, None] == columns.states[None, :])
+    location[rows.cities[:, None] == columns.cities[None, :]] = 1.0
+    location *= LOCATION_WEIGHT
+    scores += location
+    return scores
+
+
+def top_k(scores, index, k):
+    # The k best scores of each row (in no particular order) and the entries
+    # of index at the same places, padded with -inf / -1 to k columns
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, index = np.take_along_axis(scores, best, axis=1), np.take_along_axis(index, best, axis=1)
+    elif scores.shape[1] < k:
+        missing = k - scores.shape[1]
+        scores = np.concatenate([scores, np.full((len(scores), missing), -np.inf, np.float32)], axis=1)
+        index = np.concatenate([index, np.full((len(index), missing), -1, np.int64)], axis=1)
+    return index, scores
+
+
+def best_matches(rows, columns, k=TOP_K, by_column=True):
+    # Returns ((n, k) column indexes and scores of the best columns for each
+    # row, (m, k) row indexes and scores of the best rows for each column);
+    # the second is None unless by_column
+    n, m = len(rows), len(columns)
+    row_index, row_scores = np.full((n, k), -1, np.int64), np.full((n, k), -np.inf, np.float32)
+    column_index, column_scores = np.full((m, k), -1, np.int64), np.full((m, k), -np.inf, np.float32)
+    column_kth = np.full(m, -np.inf, np.float32)
+    block = max(1, BLOCK_CELLS // max(m, 1))
+    for start in range(0, n if m else 0, block):
+        stop = min(n, start + block)
+        scores = score_block(rows.take(slice(start, stop)), columns)
+        row_index[start:stop], row_scores[start:stop] = \
+            top_k(scores, np.broadcast_to(np.arange(m), scores.shape), k)
+        if by_column:
+            # Merge this block into the best rows found so far, only for the
+            # columns where it beats the k-th best (few, after the first blocks)
+            changed = np.flatnonzero((scores > column_kth).any(axis=0))
+            if len(changed):
+                column_index[changed], column_scores[changed] = top_k(
+                    np.concatenate([column_scores[changed], scores[:, changed].T], axis=1),
+                    np.concatenate([column_index[changed],
+                                    np.broadcast_to(np.arange(start, stop), (len(changed), stop - start))], axis=1),
+                    k)
+                column_kth[changed] = column_scores[changed].min(axis=1)
+    return (row_index, row_scores), ((column_index, column_scores) if by_column else None)
+
+
+def list_rows(side, owner_ids, candidate_ids, index, scores, keep=None):
+    # Insert parameters for the match lists of owner_ids; keep optionally
+    # masks the entries to insert
+    mask = (index >= 0) & (scores > 0)
+    if keep is not None:
+        mask &= keep
+    owners = np.broadcast_to(owner_ids[:, None], index.shape)[mask]
+    return [{side.owner.key: int(owner), side.candidate.key: int(candidate), 'score': round(float(score), 6)}
+            for owner, candidate, score in zip(owners, candidate_ids[index[mask]], scores[mask])]
+
+
+def write_lists(side, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(side.matches.insert(), rows[start:start + BATCH_SIZE])
+
+
+def id_chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def mark_matched(side, started, ids=None):
+    # Entities edited after started stay stale for the next refresh.
+    # updated_at and profile_updated_at are set to themselves, or their
+    # onupdate would bump them.
+    model = side.model
+    query = db.session.query(model).filter(model.profile_updated_at <= started)
+    queries = [query] if ids is None else [query.filter(model.id.in_(chunk)) for chunk in id_chunks(ids)]
+    for query in queries:
+        query.update({model.matched_at: model.profile_updated_at, model.updated_at: model.updated_at,
+                      model.profile_updated_at: model.profile_updated_at}, synchronize_session=False)
+
+
+def load_both():
+    words, city_codes, state_codes = genre_words(), {}, {}
+    return load_features(ARTISTS, city_codes, state_codes, words), load_features(VENUES, city_codes, state_codes, words)
+
+
+def rebuild(k=TOP_K):
+    started = datetime.now()
+    artists, venues = load_both()
+    (artist_best, artist_scores), (venue_best, venue_scores) = best_matches(artists, venues, k)
+    for side in (ARTISTS, VENUES):
+        db.session.execute(side.matches.delete())
+    write_lists(ARTISTS, list_rows(ARTISTS, artists.ids, venues.ids, artist_best, artist_scores))
+    write_lists(VENUES, list_rows(VENUES, venues.ids, artists.ids, venue_best, venue_scores))
+    for side in (ARTISTS, VENUES):
+        mark_matched(side, started)
+    return len(artists), len(venues)
+
+
+def stale_ids(side):
+    model = side.model
+    return {id for (id,) in db.session.query(model.id).filter(
+        or_(model.matched_at.is_(None), model.profile_updated_at > model.matched_at))}
+
+
+def refresh_lists(side, owners, candidates, stale_owners, stale_candidates, k):
+    # Lists that may have changed: those of stale owners and those holding
+    # a stale candidate are recomputed against every candidate
+    recompute = set(stale_owners)
+    for chunk in id_chunks(stale_candidates):
+        recompute.update(id for (id,) in db.session.query(side.owner).filter(side.candidate.in_(chunk)).distinct())
+    for chunk in id_chunks(recompute):
+        db.session.execute(side.matches.delete().where(side.owner.in_(chunk)))
+    recomputed = np.isin(owners.ids, list(recompute))
+    subset = owners.take(recomputed)
+    (best, scores), _ = best_matches(subset, candidates, k, by_column=False)
+    write_lists(side, list_rows(side, subset.ids, candidates.ids, best, scores))
+
+    # The other lists hold no stale candidate: they only change where one
+    # now beats their last entry (or they are not full yet)
+    others = owners.take(~recomputed)
+    new = candidates.take(np.isin(candidates.ids, list(stale_candidates)))
+    if not len(others) or not len(new):
+        return
+    (best, scores), _ = best_matches(others, new, k, by_column=False)
+    thresholds = np.full(len(others), -np.inf, np.float32)
+    full = db.session.query(side.owner, func.min(side.matches.c.score))\
+        .group_by(side.owner).having(func.count() >= k).all()
+    if full:
+        full = np.array(full, dtype=np.float64).reshape(-1, 2)
+        positions = np.minimum(np.searchsorted(others.ids, full[:, 0]), len(others) - 1)
+        found = others.ids[positions] == full[:, 0]
+        thresholds[positions[found]] = full[found, 1]
+    entering = (scores > thresholds[:, None]) & (best >= 0) & (scores > 0)
+    write_lists(side, list_rows(side, others.ids, new.ids, best, scores, entering))
+
+    # Cut the lists that grew back to k entries
+    grown = others.ids[entering.any(axis=1)]
+    extra = []
+    for chunk in id_chunks(grown.tolist()):
+        rows = db.session.query(side.owner, side.candidate)\
+            .filter(side.owner.in_(chunk))\
+            .order_by(side.owner, side.matches.c.score.desc(), side.candidate)
+        previous, rank = None, 0
+        for owner, candidate in rows:
+            rank = rank + 1 if owner == previous else 1
+            previous = owner
+            if rank > k:
+                extra.append({'owner_id': owner, 'candidate_id': candidate})
+    if extra:
+        db.session.execute(side.matches.delete().where(side.owner == bindparam('owner_id'),
+                                                       side.candidate == bindparam('candidate_id')), extra)
+
+
+def refresh(k=TOP_K):
+    # Returns the number of stale artists and venues handled
+    started = datetime.now()
+    stale_artists, stale_venues = stale_ids(ARTISTS), stale_ids(VENUES)
+    if stale_artists or stale_venues:
+        artists, venues = load_both()
+        refresh_lists(ARTISTS, artists, venues, stale_artists, stale_venues, k)
+        refresh_lists(VENUES, venues, artists, stale_venues, stale_artists, k)
+        mark_matched(ARTISTS, started, stale_artists)
+        mark_matched(VENUES, started, stale_venues)
+    return len(stale_artists), len(stale_venues)
+
+
+def forget_venue(venue_id):
+    # Before deleting a venue: drop it from the lists and have the next
+    # refresh fill the artist lists it leaves short
+    listed_by = select(artist_matches.c.artist_id).where(artist_matches.c.venue_id == venue_id)
+    db.session.query(Artist).filter(Artist.id.in_(listed_by))\
+        .update({Artist.matched_at: None, Artist.updated_at: Artist.updated_at,
+                 Artist.profile_updated_at: Artist.profile_updated_at}, synchronize_session=False)
+    db.session.execute(artist_matches.delete().where(artist_matches.c.venue_id == venue_id))
+    db.session.execute(venue_matches.delete().where(venue_matches.c.venue_id == venue_id))
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+@click.group('matches')
+def matches_command():
+    """Maintain the artist/venue match lists."""
+
+
+@matches_command.command('refresh')
+def refresh_command():
+    """Update the match lists for artists and venues changed since the last run."""
+    artists, venues = refresh()
+    db.session.commit()
+    click.echo('%d artists and %d venues refreshed' % (artists, venues))
+
+
+@matches_command.command('rebuild')
+def rebuild_command():
+    """Recompute every match list."""
+    artists, venues = rebuild()
+    db.session.commit()
+    click.echo('%d seeking artists matched with %d seeking venues' % (artists, venues))
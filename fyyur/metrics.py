@@ -0,0 +1,122 @@
+import os
+import time
+from flask import g, request, Response, before_render_template, template_rendered
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess
+)
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+# Prometheus metrics served at /metrics. Under gunicorn every worker has its
+# own counters; set PROMETHEUS_MULTIPROC_DIR to an empty directory before
+# starting it (see gunicorn.conf.py) and /metrics aggregates the files all
+# workers write there. Gauges are summed over the live workers.
+#
+# Pool metrics come from MeteredQueuePool, which replaces the default pool
+# when the database has pool settings (i.e. not SQLite, see
+# config.engine_options).
+
+REQUEST_LATENCY = Histogram('fyyur_request_duration_seconds', 'Request latency by endpoint',
+                            ['method', 'endpoint', 'status'])
+REQUESTS_IN_PROGRESS = Gauge('fyyur_requests_in_progress', 'Requests being handled',
+                             multiprocess_mode='livesum')
+TEMPLATE_RENDER = Histogram('fyyur_template_render_seconds', 'Template render time', ['template'])
+POOL_CHECKOUT_WAIT = Histogram('fyyur_db_pool_checkout_seconds', 'Time spent waiting for a pooled connection',
+                               buckets=(.0005, .001, .005, .01, .05, .1, .5, 1, 5, 10, 30))
+POOL_CHECKOUT_TIMEOUTS = Counter('fyyur_db_pool_checkout_timeouts', 'Pool checkouts that timed out')
+POOL_CHECKED_OUT = Gauge('fyyur_db_pool_checked_out', 'Connections checked out of the pool',
+                         multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('fyyur_db_pool_overflow', 'Connections open beyond pool_size',
+                      multiprocess_mode='livesum')
+
+
+class MeteredQueuePool(QueuePool):
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super(MeteredQueuePool, self)._do_get()
+        except PoolTimeout:
+            POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+        self.update_gauges()
+        return connection
+
+    def _do_return_conn(self, record):
+        super(MeteredQueuePool, self)._do_return_conn(record)
+        self.update_gauges()
+
+    def update_gauges(self):
+        POOL_CHECKED_OUT.set(self.checkedout())
+        POOL_OVERFLOW.set(max(0, self.overflow()))
+
+
+def start_timer():
+    g.metrics_started_at = time.perf_counter()
+    REQUESTS_IN_PROGRESS.inc()
+
+
+def observe_request(response):
+    if 'metrics_started_at' in g:
+        REQUEST_LATENCY.labels(request.method, request.endpoint or 'unmatched', response.status_code)\
+            .observe(time.perf_counter() - g.metrics_started_at)
+    return response
+
+
+def stop_timer(error=None):
+    if g.pop('metrics_started_at', None) is not None:
+        REQUESTS_IN_PROGRESS.dec()
+
+
+def template_started(sender, template, context, **extra):
+    g.setdefault('template_started_at', []).append(time.perf_counter())
+
+
+def template_finished(sender, template, context, **extra):
+    started = g.get('template_started_at')
+    if started:
+        TEMPLATE_RENDER.labels(template.name or 'string').observe(time.perf_counter() - started.pop())
+
+
+def metrics_view():
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+class Metrics(object):
+    # Flask extension; init_app must run before db.init_app so the engine is
+    # built with the metered pool
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        if 'pool_size' in options:
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(options, poolclass=MeteredQueuePool)
+        app.before_request(start_timer)
+        app.after_request(observe_request)
+        app.teardown_request(stop_timer)
+        before_render_template.connect(template_started, app)
+        template_rendered.connect(template_finished, app)
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
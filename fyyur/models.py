@@ -1,5 +1,5 @@
 from fyyur import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 
 
@@ -11,12 +11,63 @@ from flask_sqlalchemy import SQLAlchemy
 #----------------------------------------------------------------------------#
 
 
-def convert_db_genres_to_list(genres):
-    return genres[1:-1].split(',')
+# Genres are normalised into the genre table and linked through these
+# association tables. The (genre_id, venue|artist_id) indexes serve the
+# genre filters on the listing and search views.
+venue_genres = db.Table(
+    'venue_genre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_venue_genre_genre_id_venue_id', 'genre_id', 'venue_id')
+)
+
+artist_genres = db.Table(
+    'artist_genre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genre.id'), primary_key=True),
+    db.Index('ix_artist_genre_genre_id_artist_id', 'genre_id', 'artist_id')
+)
+
+# Top-K match lists (fyyur/matching.py): the best venues for each artist
+# seeking a venue and the best artists for each venue seeking talent
+artist_matches = db.Table(
+    'artist_match',
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Index('ix_artist_match_artist_id_score', 'artist_id', 'score')
+)
+
+venue_matches = db.Table(
+    'venue_match',
+    db.Column('venue_id', db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('artist_id', db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('score', db.Float, nullable=False),
+    db.Index('ix_venue_match_venue_id_score', 'venue_id', 'score')
+)
+
+
+class Genre(db.Model):
+    __tablename__ = 'genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    @classmethod
+    def from_names(cls, names):
+        # Existing Genre rows for the given names, new (unsaved) ones for the rest
+        names = list(dict.fromkeys(names))
+        existing = {genre.name: genre for genre in cls.query.filter(cls.name.in_(names))}
+        return [existing.get(name) or cls(name=name) for name in names]
 
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    __table_args__ = (
+        # Trigram index backing substring search (see fyyur/search.py)
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -24,14 +75,32 @@ class Venue(db.Model):
     state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
     facebook_link = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
+    # Like updated_at, but left alone by the show counters and the match
+    # lists, so it only moves when the artist or venue itself changes
+    profile_updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                                   server_default=db.func.now())
+    # Maintained by fyyur/counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Centre of the venue's city and its geohash, set by fyyur/geo.py
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
+    # profile_updated_at when its match lists were last computed (fyyur/matching.py)
+    matched_at = db.Column(db.DateTime)
     shows = db.relationship('Show', backref='venue', lazy=True)
 
+    def genre_names(self):
+        return [genre.name for genre in self.genres]
+
     def venue_to_dictionary(self):
         data = {'id': self.id,
                 'name': self.name,
@@ -39,39 +108,71 @@ class Venue(db.Model):
                 'state': self.state,
                 'address': self.address,
                 'phone': self.phone,
-                'genres': convert_db_genres_to_list(self.genres),
+                'genres': self.genre_names(),
                 'facebook_link': self.facebook_link,
                 'image_link': self.image_link,
                 'website': self.website,
-                'seeking_talent': self.website,
+                'seeking_talent': self.seeking_talent,
                 'seeking_description': self.seeking_description
                 }
         return data
 
 
+class Place(db.Model):
+    # Offline geocoding table: the centre of each city, keyed by the
+    # lowercased city name and the state (see fyyur/geo.py)
+    __tablename__ = 'place'
+    __table_args__ = (
+        db.UniqueConstraint('city', 'state', name='uq_place_city_state'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+
+
 class Artist(db.Model):
     __tablename__ = 'artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120), nullable=False)
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
     facebook_link = db.Column(db.String(120), nullable=False)
     image_link = db.Column(db.String(500))
     website = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
+    # Like updated_at, but left alone by the show counters and the match
+    # lists, so it only moves when the artist or venue itself changes
+    profile_updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                                   server_default=db.func.now())
+    # Maintained by fyyur/counters.py
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    matched_at = db.Column(db.DateTime)
     shows = db.relationship('Show', backref='artist', lazy=True)
 
+    def genre_names(self):
+        return [genre.name for genre in self.genres]
+
     def artist_to_dictionary(self):
         data = {
             'id': self.id,
             'name': self.name,
             'city': self.city,
             'phone': self.phone,
-            'genres': convert_db_genres_to_list(self.genres),
+            'genres': self.genre_names(),
             'facebook_link': self.facebook_link,
             'image_link': self.image_link,
             'website': self.website,
@@ -81,10 +182,36 @@ class Artist(db.Model):
         return data
 
 
+# Shows without an explicit end last DEFAULT_SHOW_DURATION; none may last
+# longer than MAX_SHOW_DURATION, which bounds the overlap checks in
+# fyyur/bookings.py
+DEFAULT_SHOW_DURATION = timedelta(hours=3)
+MAX_SHOW_DURATION = timedelta(hours=24)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
+
 class Show(db.Model):
     __tablename__ = 'show'
+    __table_args__ = (
+        # Detail pages and search filter shows by venue/artist and split them
+        # on start_time; /shows pages through (start_time, id).
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        # Shows the counters still count as upcoming, for the rollover job
+        db.Index('ix_show_counted_upcoming_start_time', 'start_time',
+                 postgresql_where=db.text('counted_upcoming'), sqlite_where=db.text('counted_upcoming')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), nullable=False)
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.now())
\ No newline at end of file
+    start_time = db.Column(db.DateTime, nullable=False, default=datetime.now())
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
+    # Whether this show is counted in its venue's and artist's upcoming_shows_count
+    counted_upcoming = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now, onupdate=datetime.now,
+                           server_default=db.func.now(), index=True)
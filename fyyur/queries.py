@@ -0,0 +1,191 @@
+from datetime import datetime
+from itertools import groupby
+from sqlalchemy import case, func, tuple_
+from sqlalchemy.orm import joinedload
+from fyyur import db
+from fyyur.models import Venue, Artist, Show, Genre
+
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+
+def genre_filter(model, genre):
+    # EXISTS over the genre association table, served by its
+    # (genre_id, <entity>_id) index
+    return model.genres.any(Genre.name == genre)
+
+
+def venue_area_rows(genre=None):
+    # Only the four columns the listing needs, already ordered by area so
+    # the grouping below is a single pass.
+    query = db.session.query(Venue.state, Venue.city, Venue.id, Venue.name)\
+        .order_by(Venue.state, Venue.city, Venue.id)
+    if genre:
+        query = query.filter(genre_filter(Venue, genre))
+    return query
+
+
+def group_venues_by_area(rows):
+    # rows must be ordered by (state, city); each area is emitted once with
+    # the id/name of every venue in it.
+    areas = []
+    for (state, city), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{'id': venue[2], 'name': venue[3]} for venue in venues]
+        })
+    return areas
+
+
+def venue_areas(genre=None):
+    return group_venues_by_area(venue_area_rows(genre))
+
+
+
+#  Detail pages
+#  ----------------------------------------------------------------
+# Entity row plus every show with its counterpart's id, name and image in a
+# second JOIN query; the past/upcoming split is done on the fetched rows.
+
+def shows_with_counterpart(show_fk, entity_id, counterpart, prefix):
+    rows = db.session.query(Show.start_time, counterpart.id, counterpart.name, counterpart.image_link)\
+        .join(counterpart, getattr(Show, prefix + '_id') == counterpart.id)\
+        .filter(show_fk == entity_id)\
+        .order_by(Show.start_time)\
+        .all()
+
+    now = datetime.now()
+    past_shows = []
+    upcoming_shows = []
+    for start_time, id, name, image_link in rows:
+        show = {
+            prefix + '_id': id,
+            prefix + '_name': name,
+            prefix + '_image_link': image_link,
+            'start_time': start_time
+        }
+        if start_time < now:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+def add_shows(data, past_shows, upcoming_shows):
+    data['past_shows'] = past_shows
+    data['upcoming_shows'] = upcoming_shows
+    data['past_shows_count'] = len(past_shows)
+    data['upcoming_shows_count'] = len(upcoming_shows)
+    return data
+
+
+def venue_detail(venue_id):
+    venue = db.session.get(Venue, venue_id, options=[joinedload(Venue.genres)])
+    if venue is None:
+        return None
+    return add_shows(venue.venue_to_dictionary(),
+                     *shows_with_counterpart(Show.venue_id, venue_id, Artist, 'artist'))
+
+
+def artist_detail(artist_id):
+    artist = db.session.get(Artist, artist_id, options=[joinedload(Artist.genres)])
+    if artist is None:
+        return None
+    return add_shows(artist.artist_to_dictionary(),
+                     *shows_with_counterpart(Show.artist_id, artist_id, Venue, 'venue'))
+
+
+#  Keyset pagination
+#  ----------------------------------------------------------------
+# Pages are fetched with "WHERE key > last key ORDER BY key LIMIT n + 1", so
+# the cost of a page does not depend on how deep into the listing it is. The
+# extra row tells us whether there is a next page.
+
+def split_page(rows, limit):
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]
+    return rows, None
+
+
+def artist_page(after=None, limit=50, genre=None):
+    query = db.session.query(Artist.id, Artist.name).order_by(Artist.id)
+    if genre:
+        query = query.filter(genre_filter(Artist, genre))
+    if after is not None:
+        query = query.filter(Artist.id > after)
+    rows, last = split_page(query.limit(limit + 1).all(), limit)
+    return rows, (last.id if last else None)
+
+
+def encode_show_cursor(start_time, show_id):
+    return '%s_%d' % (start_time.strftime('%Y-%m-%dT%H:%M:%S.%f'), show_id)
+
+
+def decode_show_cursor(cursor):
+    # Raises ValueError for malformed cursors
+    start_time, show_id = cursor.rsplit('_', 1)
+    return datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S.%f'), int(show_id)
+
+
+def show_page(after=None, limit=50):
+    query = db.session.query(Show.id,
+                             Show.venue_id,
+                             Venue.name.label('venue_name'),
+                             Show.artist_id,
+                             Artist.name.label('artist_name'),
+                             Artist.image_link.label('artist_image_link'),
+                             Show.start_time)\
+        .join(Artist, Show.artist_id == Artist.id)\
+        .join(Venue, Show.venue_id == Venue.id)\
+        .order_by(Show.start_time, Show.id)
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.id) > tuple_(*after))
+    rows, last = split_page(query.limit(limit + 1).all(), limit)
+    return rows, (encode_show_cursor(last.start_time, last.id) if last else None)
+
+
+#  Page versions
+#  ----------------------------------------------------------------
+# Cheap aggregates that change whenever the corresponding page would render
+# differently; used for ETag / Last-Modified (see fyyur/conditional.py).
+# Detail pages also depend on the clock: the latest start_time that has
+# already passed moves a show from "upcoming" to "past".
+
+def listing_version(model):
+    return db.session.query(func.count(model.id), func.max(model.updated_at)).one()
+
+
+def shows_version():
+    # Independent scalar subqueries, each answered from an index, instead of
+    # aggregating over the show/artist/venue join
+    return db.session.query(db.session.query(func.count(Show.id)).scalar_subquery(),
+                            db.session.query(func.max(Show.updated_at)).scalar_subquery(),
+                            db.session.query(func.max(Artist.updated_at)).scalar_subquery(),
+                            db.session.query(func.max(Venue.updated_at)).scalar_subquery())\
+        .one()
+
+
+def detail_version(model, show_fk, counterpart, counterpart_fk, entity_id):
+    now = datetime.now()
+    return db.session.query(model.updated_at,
+                            func.count(Show.id),
+                            func.max(Show.updated_at),
+                            func.max(counterpart.updated_at),
+                            func.max(case((Show.start_time <= now, Show.start_time))))\
+        .select_from(model)\
+        .outerjoin(Show, show_fk == model.id)\
+        .outerjoin(counterpart, counterpart_fk == counterpart.id)\
+        .filter(model.id == entity_id)\
+        .group_by(model.id, model.updated_at)\
+        .one_or_none()
+
+
+def venue_version(venue_id):
+    return detail_version(Venue, Show.venue_id, Artist, Show.artist_id, venue_id)
+
+
+def artist_version(artist_id):
+    return detail_version(Artist, Show.artist_id, Venue, Show.venue_id, artist_id)
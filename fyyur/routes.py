@@ -1,6 +1,10 @@
 import dateutil.parser
-import babel
+from functools import lru_cache
+from babel import Locale
+from babel.dates import parse_pattern
 from flask import (
+    Blueprint,
+    current_app,
     render_template,
     request,
     Response,
@@ -10,38 +14,97 @@ from flask import (
     abort,
     jsonify
 )
-from fyyur import app, db
-from fyyur.models import Venue, Artist, Show
+from fyyur import db, cache, suggestions
+from fyyur.models import Venue, Artist, Show, Genre, DEFAULT_SHOW_DURATION
+from fyyur.queries import (
+    venue_areas,
+    venue_detail,
+    artist_detail,
+    artist_page,
+    show_page,
+    decode_show_cursor,
+    listing_version,
+    shows_version,
+    venue_version,
+    artist_version
+)
+from fyyur.search import search_venues_by_name, search_artists_by_name
+from fyyur.conditional import conditional_get
+from fyyur.counters import count_new_shows, uncount_shows
+from fyyur.bookings import lock_bookings, overlapping_shows, conflict_messages
+from fyyur.matching import forget_venue
+from fyyur.geo import locate_venue
+from fyyur.export import EXPORTS, CONTENT_TYPES, export_response
 from fyyur.forms import *
 import logging
-import sys
+
+
+bp = Blueprint('main', __name__)
+logger = logging.getLogger(__name__)
 
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+# Babel patterns and locales are parsed once; formatted values are memoised
+# since listing and detail pages repeat the same start times on every hit.
+datetime_patterns = dict((name, parse_pattern(pattern)) for name, pattern in DATETIME_FORMATS.items())
+
+
+@lru_cache(maxsize=16)
+def datetime_locale(locale):
+    return Locale.parse(locale)
+
+
+@lru_cache(maxsize=16384)
+def cached_format_datetime(value, format, locale):
+    pattern = datetime_patterns.get(format) or parse_pattern(format)
+    return pattern.apply(value, datetime_locale(locale))
 
-app.jinja_env.filters['datetime'] = format_datetime
 
+@bp.app_template_filter('datetime')
+def format_datetime(value, format='medium', locale='en'):
+    # Views pass datetime objects; strings are still accepted
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    return cached_format_datetime(value, format, locale)
 
-def convert_db_genres_to_list(genres):
-    return genres[1:-1].split(',')
+
+def page_size():
+    # ?limit= for the paginated listings, clamped to the configured maximum
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+
+def suggest_limit():
+    # ?limit= for the typeahead endpoints, clamped like page_size()
+    limit = request.args.get('limit', current_app.config['SUGGEST_LIMIT'], type=int)
+    return max(1, min(limit, current_app.config['MAX_SUGGEST_LIMIT']))
+
+
+# Cache tags of the pages showing a venue/artist: its own page, the listings
+# and the pages of everyone it shares a show with
+def venue_tags(venue_id):
+    artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+    return ['venue:%s' % venue_id, 'venues', 'shows'] + ['artist:%s' % id for (id,) in artist_ids]
+
+
+def artist_tags(artist_id):
+    venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+    return ['artist:%s' % artist_id, 'artists', 'shows'] + ['venue:%s' % id for (id,) in venue_ids]
 
 
 # Capture all the form validation errors
 def error_message(form):
     message = []
     for field, errors in form.errors.items():
-        print("error: ", errors)
-        print("Filed: ", form[field].name)
+        logger.debug('Invalid %s: %s', form[field].name, ', '.join(errors))
         # message.append(str(show_form[field].label) + ' ' + ', '.join(errors))
         message.append(', '.join(errors))
     return message
@@ -51,7 +114,8 @@ def error_message(form):
 #----------------------------------------------------------------------------#
 
 
-@app.route('/')
+@bp.route('/')
+@cache.cached(lambda: ['home'])
 def index():
     return render_template('pages/home.html')
 
@@ -59,142 +123,47 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@conditional_get(lambda: listing_version(Venue))
+@cache.cached(lambda: ['venues'])
 def venues():
+    # One ordered query for (state, city, id, name), grouped by area in a
+    # single pass
+    genre = request.args.get('genre')
+    data = venue_areas(genre)
+    return render_template('pages/venues.html', areas=data, genres=genres_choices, genre=genre)
+
 
-    locals = []
-    # Get all the locations (unique)
-    locations = Venue.query.distinct(Venue.state, Venue.city).all()
-
-    # Store all the locations as list of dict (local) in locals
-    for location in locations:
-        local = {
-          'city': location.city,
-          'state': location.state
-        }
-        locals.append(local)
-
-    # Get all the venues from the database
-    venues = Venue.query.all()
-
-    # Store all the venues in each locations as a list (id and name)
-    for local in locals:
-        local['venues'] = []
-        for venue in venues:
-            if venue.city == local['city'] and venue.state == local['state']:
-                v = {
-                    'id': venue.id,
-                    'name': venue.name
-                }
-                local['venues'].append(v)
-
-    # from pprint import pprint
-    # pprint(locals)
-    data = locals
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
 def search_venues():
     search_term = request.form.get('search_term', ' ')
-    data = []
-    venues = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all()
-
-    for venue in venues:
-        num_upcoming_shows = 0
-        shows = Show.query.filter(Show.venue_id == venue.id)
-        for show in shows:
-            if show.start_time > datetime.now():
-                num_upcoming_shows +=1
-
-        data.append({
-            "id": venue.id,
-            "name": venue.name,
-            "num_upcoming_shows": num_upcoming_shows
-        })
-
-    response = {
-        "count": len(venues),
-        "data": data
-    }
+    response = search_venues_by_name(search_term, request.values.get('genre'))
 
     return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
 
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@conditional_get(venue_version)
+@cache.cached(lambda venue_id: ['venue:%s' % venue_id])
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
+    data = venue_detail(venue_id)
+    if data is None:
+        abort(404)
 
-    venue = Venue.query.get(venue_id)
-    data = venue.venue_to_dictionary()
-
-    pastshows = []
-    upcomingshows = []
-
-    # past_shows = list(filter(lambda x: x.start_time < datetime.today(), venue.shows))
-    #########
-    # SELECT show.artist_id, artist.name, artist.image_link, show.start_time FROM show JOIN artist ON
-    #  show.artist_id = artist.id;
-    ####################################
-    # Using JOIN (easier than without JOIN!!!! :))
-    past_shows = db.session.query(Show).join(Artist).filter(Show.venue_id == venue_id).filter(Show.start_time < datetime.now()).all()
-
-    # print("New Past Show: ", past_shows_test)
-    # for show in past_shows_test:
-    #     print("xxx", show.venue_id)
-    #     print('name', show.artist.name)
-
-    # Without using JOIN
-    upcoming_shows = list(filter(lambda x: x.start_time > datetime.today(), venue.shows))
-
-    past_shows_count = len(past_shows)
-    upcoming_shows_count = len(upcoming_shows)
-
-    for show in past_shows:
-        # artist = Artist.query.get(pshow.artist_id)
-        show = {
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        pastshows.append(show)
-
-    # print(pastshows)
-
-    for fshow in upcoming_shows:
-        # Without using Join
-        artist = Artist.query.get(fshow.artist_id)
-        show = {
-            "artist_id": artist.id,
-            "artist_name": artist.name,
-            "artist_image_link": artist.image_link,
-            "start_time": fshow.start_time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        upcomingshows.append(show)
-
-    # print(upcomingshows)
-
-    data['past_shows'] = pastshows
-    data['upcoming_shows'] = upcomingshows
-    data['past_shows_count'] = len(pastshows)
-    data['upcoming_shows_count'] = len(upcomingshows)
-    # print("data: ", data)
-
-    # data = list(filter(lambda d: d['id'] == venue_id, [data1, data2, data3]))[0]
     return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     error = False
     venue_form = VenueForm(request.form, meta={'csrf': False})
@@ -207,22 +176,24 @@ def create_venue_submission():
                           state=venue_form.state.data,
                           address=venue_form.address.data,
                           phone=venue_form.phone.data,
-                          genres=venue_form.genres.data,
+                          genres=Genre.from_names(venue_form.genres.data),
                           facebook_link=venue_form.facebook_link.data,
                           image_link=venue_form.image_link.data,
                           website=venue_form.website_link.data,
                           seeking_talent=venue_form.seeking_talent.data,
                           seeking_description=venue_form.seeking_description.data
                           )
-            print("Venue Name: ", venue.name)
-            print("Venue Name: ", venue_form.name.data)
+            locate_venue(venue)
+            logger.debug('Creating venue %r', venue.name)
 
             db.session.add(venue)
             db.session.commit()
+            cache.invalidate('venues')
+            suggestions.invalidate('venue')
         except:
             error = True
             db.session.rollback()
-            print(sys.exc_info)
+            logger.exception('Could not create venue %r', venue_form.name.data)
         finally:
             db.session.close()
             if error:
@@ -236,143 +207,84 @@ def create_venue_submission():
                 return render_template('pages/home.html')
     else:
         flash('Errors: ' + '|'.join(error_message(venue_form)))
-        return redirect(url_for('create_venue_form'))
+        return redirect(url_for('.create_venue_form'))
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
     error = False
-    print("Inside DELETE")
+    logger.debug('Deleting venue %s', venue_id)
     try:
         venue = Venue.query.get(venue_id)
+        tags = venue_tags(venue_id)
 
+        uncount_shows(venue.shows)
+        forget_venue(venue.id)
         for show in venue.shows:
             db.session.delete(show)
         db.session.delete(venue)
         db.session.commit()
-        print("Inside DELETE - TRY")
+        cache.invalidate(*tags)
+        suggestions.invalidate('venue')
     except:
         error = True
         db.session.rollback()
-        print(sys.exc_info())
-        print("Inside DELETE - EXCEPT")
+        logger.exception('Could not delete venue %s', venue_id)
     finally:
         db.session.close()
-        print("Inside DELETE - FINALLY")
         if error:
             # flash('An error occurred. Venue ' + request.form['name'] + ' could not be deleted.')
-            print("Inside DELETE - FINALLY - ERROR = TRUE")
             abort(500)
-        else:
-            # on successful db insert, flash success
-            # flash('Venue ' + request.form['name'] + ' was successfully deleted!')
-            # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-            # clicking that button delete it from the db then redirect the user to the homepage
-            print("Inside DELETE, before RETURN, error = FALSE")
-
-        print("Inside DELETE - FINALLY, before return")
+        # on successful db insert, flash success
+        # flash('Venue ' + request.form['name'] + ' was successfully deleted!')
+        # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
+        # clicking that button delete it from the db then redirect the user to the homepage
+
         # return render_template('pages/home.html')
         return jsonify({'success': True})
 
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@conditional_get(lambda: listing_version(Artist))
+@cache.cached(lambda: ['artists'])
 def artists():
-    data = Artist.query.order_by('id').all()
+    after = request.args.get('after', type=int)
+    genre = request.args.get('genre')
+    limit = page_size()
+    data, next_cursor = artist_page(after, limit, genre)
 
-    return render_template('pages/artists.html', artists=data)
+    return render_template('pages/artists.html', artists=data, next_cursor=next_cursor,
+                           first_page=after is None, limit=limit, genres=genres_choices, genre=genre)
 
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
 def search_artists():
     # Sseach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
     search_term = request.form.get('search_term', ' ')
-    data = []
-    artists = Artist.query.filter(Artist.name.ilike('%' + search_term + '%')).all()
-
-    for artist in artists:
-        num_upcoming_shows = 0
-        shows = Show.query.filter(Show.artist_id == artist.id)
-        for show in shows:
-            if show.start_time > datetime.now():
-              num_upcoming_shows += 1
-
-        data.append({
-          "id": artist.id,
-          "name": artist.name,
-          "num_upcoming_shows": num_upcoming_shows
-        })
+    response = search_artists_by_name(search_term, request.values.get('genre'))
 
-    response = {
-        "count": len(artists),
-        "data": data
-    }
     return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
 
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@conditional_get(artist_version)
+@cache.cached(lambda artist_id: ['artist:%s' % artist_id])
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
+    data = artist_detail(artist_id)
+    if data is None:
+        abort(404)
 
-    artist = Artist.query.get(artist_id)
-
-    # data = {}
-    data = artist.artist_to_dictionary()
-
-    pastshows = []
-    upcomingshows = []
-
-    # Using JOIN - easy to get all the data
-    past_shows = db.session.query(Show).join(Venue).filter(Show.artist_id == artist_id).filter(Show.start_time < datetime.now()).all()
-    # past_shows = list(filter(lambda x: x.start_time < datetime.today(), artist.shows))
-    # Without using JOIN
-    upcoming_shows = list(filter(lambda x: x.start_time > datetime.today(), artist.shows))
-
-    past_shows_count = len(past_shows)
-    upcoming_shows_count = len(upcoming_shows)
-
-    for show in past_shows:
-        # venue = Venue.query.get(pshow.venue_id)
-        show = {
-            "venue_id": show.venue.id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        pastshows.append(show)
-
-    # print("past shows: ", pastshows)
-
-    for fshow in upcoming_shows:
-        venue = Venue.query.get(fshow.venue_id)
-        show = {
-            "venue_id": venue.id,
-            "venue_name": venue.name,
-            "venue_image_link": venue.image_link,
-            "start_time": fshow.start_time.strftime("%Y-%m-%d %H:%M:%S")
-        }
-        # print("Venue Image link: ", venue.image_link)
-        upcomingshows.append(show)
-
-    # print("upcoming shows: ", upcomingshows)
-
-    data['past_shows'] = pastshows
-    data['upcoming_shows'] = upcomingshows
-    data['past_shows_count'] = past_shows_count
-    data['upcoming_shows_count'] = upcoming_shows_count
-
-    # print("data: ", data)
-
-    # data = list(filter(lambda d: d['id'] == artist_id, [data1, data2, data3]))[0]
     return render_template('pages/show_artist.html', artist=data)
 
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
 
@@ -384,7 +296,7 @@ def edit_artist(artist_id):
     form.city.data = artist.city
     form.state.data = artist.state
     form.phone.data = artist.phone
-    form.genres.data = artist.genres
+    form.genres.data = artist.genre_names()
     form.facebook_link.data = artist.facebook_link
     form.image_link.data = artist.image_link
     form.website_link.data = artist.website
@@ -394,14 +306,13 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     # artist record with ID <artist_id> using the new attributes
     error = False
     artist_form = ArtistForm(request.form, meta={'csrf': False})
 
     if artist_form.validate():
-        print("Form validation passed")
         try:
             artist = Artist.query.get(artist_id)
 
@@ -409,20 +320,25 @@ def edit_artist_submission(artist_id):
             artist.city = artist_form.city.data
             artist.state = artist_form.state.data
             artist.phone = artist_form.phone.data
-            artist.genres = artist_form.genres.data
+            artist.genres = Genre.from_names(artist_form.genres.data)
             artist.facebook_link = artist_form.facebook_link.data
             artist.image_link = artist_form.image_link.data
             artist.website = artist_form.website_link.data
             artist.seeking_venue = artist_form.seeking_venue.data
             artist.seeking_description = artist_form.seeking_description.data
+            # Genres live in another table; touch the row so the page version changes
+            artist.updated_at = datetime.now()
 
-            print("Image link: ", artist.image_link)
+            logger.debug('Updating artist %s', artist_id)
 
+            tags = artist_tags(artist_id)
             db.session.commit()
+            cache.invalidate(*tags)
+            suggestions.invalidate('artist')
         except:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            logger.exception('Could not update artist %s', artist_id)
         finally:
             db.session.close()
             if error:
@@ -431,13 +347,13 @@ def edit_artist_submission(artist_id):
             else:
                 # on successful db insert, flash success
                 flash('Artist ' + request.form['name'] + ' was successfully updated!')
-                return redirect(url_for('show_artist', artist_id=artist_id))
+                return redirect(url_for('.show_artist', artist_id=artist_id))
     else:
         flash('Errors: ' + '|'.join(error_message(artist_form)))
-        return redirect(url_for('show_artist', artist_id=artist_id))
+        return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
 
@@ -451,7 +367,7 @@ def edit_venue(venue_id):
     form.address.data = venue.address
     form.phone.data = venue.phone
     form.image_link.data = venue.image_link
-    form.genres.data = venue.genres
+    form.genres.data = venue.genre_names()
     form.facebook_link.data = venue.facebook_link
     form.website_link.data = venue.website
     form.seeking_talent.data = venue.seeking_talent
@@ -460,7 +376,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
 
     error = False
@@ -477,17 +393,23 @@ def edit_venue_submission(venue_id):
             venue.address = venue_form.address.data
             venue.phone = venue_form.phone.data
             venue.image_link = venue_form.image_link.data
-            venue.genres = venue_form.genres.data
+            venue.genres = Genre.from_names(venue_form.genres.data)
             venue.facebook_link = venue_form.facebook_link.data
             venue.website = venue_form.website_link.data
             venue.seeking_talent = venue_form.seeking_talent.data
             venue.seeking_description = venue_form.seeking_description.data
+            locate_venue(venue)
+            # Genres live in another table; touch the row so the page version changes
+            venue.updated_at = datetime.now()
 
+            tags = venue_tags(venue_id)
             db.session.commit()
+            cache.invalidate(*tags)
+            suggestions.invalidate('venue')
         except:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            logger.exception('Could not update venue %s', venue_id)
         finally:
             db.session.close()
             if error:
@@ -497,29 +419,28 @@ def edit_venue_submission(venue_id):
                 # on successful db insert, flash success
                 flash('Venue ' + request.form['name'] + ' was successfully updated!')
                 # venue record with ID <venue_id> using the new attributes
-                return redirect(url_for('show_venue', venue_id=venue_id))
+                return redirect(url_for('.show_venue', venue_id=venue_id))
     else:
         flash('Errors: ' + '|'.join(error_message(venue_form)))
-        return redirect(url_for('show_venue', venue_id=venue_id))
+        return redirect(url_for('.show_venue', venue_id=venue_id))
 
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
 
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # called upon submitting the new artist listing form
     error = False
     artist_form = ArtistForm(request.form, meta={'csrf': False})
-    print("Form.errors: ", artist_form.errors)
 
     if artist_form.validate():
         try:
@@ -528,22 +449,23 @@ def create_artist_submission():
                             city=artist_form.city.data,
                             state=artist_form.state.data,
                             phone=artist_form.phone.data,
-                            genres=artist_form.genres.data,
+                            genres=Genre.from_names(artist_form.genres.data),
                             facebook_link=artist_form.facebook_link.data,
                             image_link=artist_form.image_link.data,
                             website=artist_form.website_link.data,
                             seeking_venue=artist_form.seeking_venue.data,
                             seeking_description=artist_form.seeking_description.data)
 
-            print("Artist Name: ", artist.name)
-            print("Artist Name: ", artist_form.name.data)
+            logger.debug('Creating artist %r', artist.name)
 
             db.session.add(artist)
             db.session.commit()
+            cache.invalidate('artists')
+            suggestions.invalidate('artist')
         except:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            logger.exception('Could not create artist %r', artist_form.name.data)
         finally:
             db.session.close()
             if error:
@@ -555,63 +477,108 @@ def create_artist_submission():
                 return render_template('pages/home.html')
     else:
         flash('Errors: ' + '|'.join(error_message(artist_form)))
-        return redirect(url_for('create_artist_form'))
+        return redirect(url_for('.create_artist_form'))
+
+
+#  Suggestions
+#  ----------------------------------------------------------------
+
+# Typeahead for the artist/venue inputs of the show form: ?q= is matched
+# against the start of any word of the name, answered from memory
+
+@bp.route('/api/artists/suggest')
+def suggest_artists():
+    return jsonify({'data': suggestions.suggest('artist', request.args.get('q', ''), suggest_limit())})
+
+
+@bp.route('/api/venues/suggest')
+def suggest_venues():
+    return jsonify({'data': suggestions.suggest('venue', request.args.get('q', ''), suggest_limit())})
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@conditional_get(shows_version)
+@cache.cached(lambda: ['shows'])
 def shows():
-    # displays list of shows at /shows
-    shows_query = db.session.query(Show).join(Artist).join(Venue).all()
-    data =[]
+    # displays list of shows at /shows, one page at a time ordered by (start_time, id)
+    after = None
+    if request.args.get('after'):
+        try:
+            after = decode_show_cursor(request.args['after'])
+        except ValueError:
+            abort(400)
+    limit = page_size()
+    shows_page, next_cursor = show_page(after, limit)
+    data = []
 
-    for show in shows_query:
+    for show in shows_page:
         data.append({
             "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
+            "venue_name": show.venue_name,
             "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.strftime('%Y-%m-%d %H:%M:%S')
+            "artist_name": show.artist_name,
+            "artist_image_link": show.artist_image_link,
+            "start_time": show.start_time
         })
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=data, next_cursor=next_cursor,
+                           first_page=after is None, limit=limit)
 
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # called to create new shows in the db, upon submitting new show listing form
     error = False
     show_form = ShowForm(request.form, meta={'csrf': False})
     if show_form.validate():
+        try:
+            venue_id, artist_id = int(show_form.venue_id.data), int(show_form.artist_id.data)
+        except ValueError:
+            flash('Errors: Venue ID and Artist ID must be numbers')
+            return redirect(url_for('.create_show_submission'))
+        start_time = show_form.start_time.data
+        end_time = show_form.end_time.data or start_time + DEFAULT_SHOW_DURATION
+        # Locks the venue and artist until the commit below
+        venues, artists = lock_bookings([venue_id], [artist_id])
+        messages = [] if venue_id in venues else ['No venue %d' % venue_id]
+        messages += [] if artist_id in artists else ['No artist %d' % artist_id]
+        if not messages:
+            messages = conflict_messages(venue_id, artist_id,
+                                         overlapping_shows(venue_id, artist_id, start_time, end_time))
+        if messages:
+            db.session.rollback()
+            flash('Errors: ' + '|'.join(messages))
+            return redirect(url_for('.create_show_submission'))
         try:
 
-            show = Show(artist_id=show_form.artist_id.data,
-                        venue_id=show_form.venue_id.data,
-                        start_time=show_form.start_time.data)
+            show = Show(artist_id=artist_id,
+                        venue_id=venue_id,
+                        start_time=start_time,
+                        end_time=end_time)
 
-            print("artist id:", show_form.artist_id.data)
-            print("venue id:", show_form.venue_id.data)
-            print("start time:", show_form.start_time.data)
+            logger.debug('Creating show: artist %s at venue %s on %s',
+                         show_form.artist_id.data, show_form.venue_id.data, show_form.start_time.data)
 
+            count_new_shows([show])
             db.session.add(show)
             db.session.commit()
+            cache.invalidate('shows', 'venue:%s' % show_form.venue_id.data, 'artist:%s' % show_form.artist_id.data)
         except:
             error = True
             db.session.rollback()
-            print(sys.exc_info())
+            logger.exception('Could not create show')
         finally:
             if error:
-                print("Error!!!")
                 flash('An error occurred. Show could not be created.')
                 # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
                 abort(500)
@@ -620,47 +587,25 @@ def create_show_submission():
                 flash('Show was successfully listed!')
                 return render_template('pages/home.html')
     else:
-        message = []
-        for field, errors in show_form.errors.items():
-            print("error: ", errors)
-            print("Filed: ", show_form[field].name)
-            # message.append(str(show_form[field].label) + ' ' + ', '.join(errors))
-            message.append(', '.join(errors))
-        flash('Errors: ' + '|'.join(message))
-        return redirect(url_for('create_show_submission'))
+        flash('Errors: ' + '|'.join(error_message(show_form)))
+        return redirect(url_for('.create_show_submission'))
+
 
+#  Export
+#  ----------------------------------------------------------------
+
+@bp.route('/export/<kind>.<format>')
+def export(kind, format):
+    # Streams the whole table; see fyyur/export.py
+    if kind not in EXPORTS or format not in CONTENT_TYPES:
+        abort(404)
+    return export_response(kind, format)
 
-@app.errorhandler(404)
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
-
-
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
-#----------------------------------------------------------------------------#
-# Launch.
-#----------------------------------------------------------------------------#
-
-# Default port:
-if __name__ == '__main__':
-    app.run()
-
-# Or specify port manually:
-'''
-if __name__ == '__main__':
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
-'''
-
@@ -0,0 +1,89 @@
+from sqlalchemy import column, inspect, select, table, text
+from fyyur import db
+from fyyur.models import Venue, Artist
+from fyyur.queries import genre_filter
+
+
+#----------------------------------------------------------------------------#
+# Name search.
+#----------------------------------------------------------------------------#
+
+# Substring search on venue/artist names is backed by an index:
+#  - PostgreSQL: pg_trgm GIN indexes (migration 3f1c2a9d7b64). The planner
+#    uses them for ILIKE '%term%' directly, so the plain filter is kept.
+#  - SQLite: FTS5 tables with the trigram tokenizer, kept in sync by
+#    triggers. LIKE against the FTS table uses the index.
+# Trigram indexes can only serve terms of three or more characters; shorter
+# terms fall back to the plain ILIKE scan.
+
+SEARCHABLE_TABLES = ('venue', 'artist')
+MIN_INDEXED_TERM_LENGTH = 3
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "name, content='{table}', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+# Engines for which we already checked whether the FTS tables exist
+_fts_available = {}
+
+
+def fts_table_name(tablename):
+    return tablename + '_name_fts'
+
+
+def create_sqlite_search_indexes(connection):
+    # Used for local SQLite databases built with db.create_all(); the
+    # migration creates the same objects for migrated databases.
+    for tablename in SEARCHABLE_TABLES:
+        for statement in SQLITE_FTS_DDL:
+            connection.execute(text(statement.format(fts=fts_table_name(tablename), table=tablename)))
+    _fts_available.pop(connection.engine, None)
+
+
+def has_fts_index(tablename):
+    engine = db.engine
+    if engine not in _fts_available:
+        _fts_available[engine] = set(inspect(engine).get_table_names())
+    return fts_table_name(tablename) in _fts_available[engine]
+
+
+def name_filter(model, search_term):
+    pattern = '%' + search_term + '%'
+    tablename = model.__tablename__
+    if (db.engine.dialect.name == 'sqlite'
+            and len(search_term.strip()) >= MIN_INDEXED_TERM_LENGTH
+            and has_fts_index(tablename)):
+        fts = table(fts_table_name(tablename), column('rowid'), column('name'))
+        return model.id.in_(select(fts.c.rowid).where(fts.c.name.like(pattern)))
+    return model.name.ilike(pattern)
+
+
+def search_with_upcoming_shows(model, search_term, genre=None):
+    # id, name and the maintained upcoming show count (fyyur/counters.py) of
+    # every matching row; no join or aggregation over show.
+    query = db.session.query(model.id, model.name, model.upcoming_shows_count)\
+        .filter(name_filter(model, search_term))
+    if genre:
+        query = query.filter(genre_filter(model, genre))
+    rows = query.order_by(model.id).all()
+
+    data = [{'id': id, 'name': name, 'num_upcoming_shows': num_upcoming_shows}
+            for id, name, num_upcoming_shows in rows]
+    return {'count': len(data), 'data': data}
+
+
+def search_venues_by_name(search_term, genre=None):
+    return search_with_upcoming_shows(Venue, search_term, genre)
+
+
+def search_artists_by_name(search_term, genre=None):
+    return search_with_upcoming_shows(Artist, search_term, genre)
@@ -0,0 +1,99 @@
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app
+
+
+#----------------------------------------------------------------------------#
+# Name suggestions.
+#----------------------------------------------------------------------------#
+
+# In-memory prefix index over venue/artist names for the typeahead endpoints.
+# Every word of a name is a key ("The Wild Sax Band" can be found by "wild"
+# or "sax b"), kept in one sorted list so a lookup is a bisect plus a short
+# scan. Indexes are rebuilt lazily: writes mark them stale through
+# invalidate(), and SUGGEST_INDEX_TTL bounds how long another worker's
+# writes can go unnoticed.
+
+
+class PrefixIndex(object):
+
+    def __init__(self, model, ttl):
+        self.model = model
+        self.ttl = ttl
+        self.index = ([], [])
+        self.built_at = None
+        # Bumped by invalidate(); a build only counts as fresh for the
+        # generation it started in, so a write during a rebuild is not lost
+        self.generation = 0
+        self.built_generation = -1
+        self.lock = threading.Lock()
+
+    def build(self):
+        generation = self.generation
+        rows = self.model.query.with_entities(self.model.id, self.model.name).all()
+        pairs = []
+        for id, name in rows:
+            words = name.lower().split()
+            for i in range(len(words)):
+                pairs.append((' '.join(words[i:]), i, id, name))
+        pairs.sort()
+        # Swap in the new lists in one go; readers never see a partial index
+        self.index = ([pair[0] for pair in pairs], [(pair[2], pair[3]) for pair in pairs])
+        self.built_at = time.monotonic()
+        self.built_generation = generation
+
+    def invalidate(self):
+        self.generation += 1
+
+    def is_fresh(self):
+        return self.built_generation == self.generation and time.monotonic() - self.built_at < self.ttl
+
+    def ensure_fresh(self):
+        if self.is_fresh():
+            return
+        with self.lock:
+            if not self.is_fresh():
+                self.build()
+
+    def suggest(self, prefix, limit=10):
+        self.ensure_fresh()
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        keys, entries = self.index
+        results = []
+        seen = set()
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and keys[position].startswith(prefix) and len(results) < limit:
+            id, name = entries[position]
+            if id not in seen:
+                seen.add(id)
+                results.append({'id': id, 'name': name})
+            position += 1
+        return results
+
+
+class Suggestions(object):
+    # Flask extension holding one PrefixIndex per model for each app
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from fyyur.models import Venue, Artist
+        ttl = app.config.get('SUGGEST_INDEX_TTL', 60)
+        app.extensions['suggestions'] = {
+            'venue': PrefixIndex(Venue, ttl),
+            'artist': PrefixIndex(Artist, ttl),
+        }
+
+    def index(self, name):
+        return current_app.extensions['suggestions'][name]
+
+    def suggest(self, name, prefix, limit=10):
+        return self.index(name).suggest(prefix, limit)
+
+    def invalidate(self, name):
+        self.index(name).invalidate()
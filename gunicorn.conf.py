@@ -0,0 +1,16 @@
+# gunicorn -c gunicorn.conf.py 'fyyur:create_app()'
+#
+# Workers share their Prometheus metrics through files in
+# PROMETHEUS_MULTIPROC_DIR; it must exist and be emptied before every start.
+import os
+from prometheus_client import multiprocess
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a worker that has gone away
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
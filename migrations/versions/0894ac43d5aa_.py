@@ -0,0 +1,32 @@
+"""profile_updated_at for match list refreshes
+
+Revision ID: 0894ac43d5aa
+Revises: 5b1d8e07f6a9
+Create Date: 2026-10-19 09:12:41.307215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0894ac43d5aa'
+down_revision = '5b1d8e07f6a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't add a column with a non-constant default, so existing rows
+    # get a constant first. Either way they then start from updated_at, which
+    # is what matched_at was copied from.
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    default = sa.text("'1970-01-01 00:00:00'") if sqlite else sa.text('CURRENT_TIMESTAMP')
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('profile_updated_at', sa.DateTime(), server_default=default, nullable=False))
+        op.execute('UPDATE %s SET profile_updated_at = updated_at' % table)
+
+
+def downgrade():
+    for table in ('artist', 'venue'):
+        op.drop_column(table, 'profile_updated_at')
@@ -0,0 +1,34 @@
+"""show end_time
+
+Revision ID: 0c7e5b93a4d2
+Revises: f2a9c4d81e3b
+Create Date: 2026-10-18 22:03:51.447209
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0c7e5b93a4d2'
+down_revision = 'f2a9c4d81e3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Existing shows get the default duration (models.DEFAULT_SHOW_DURATION)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("UPDATE show SET end_time = start_time + interval '3 hours'")
+        op.alter_column('show', 'end_time', existing_type=sa.DateTime(), nullable=False)
+    else:
+        # Keep the fractional seconds so values compare like the ones the
+        # app writes. SQLite cannot make the column NOT NULL without
+        # rebuilding the table (and its search triggers); the app always sets it
+        op.execute("UPDATE show SET end_time = strftime('%Y-%m-%d %H:%M:%S', start_time, '+3 hours') "
+                   "|| substr(start_time, 20)")
+
+
+def downgrade():
+    op.drop_column('show', 'end_time')
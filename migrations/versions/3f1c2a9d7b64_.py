@@ -0,0 +1,56 @@
+"""trigram name search indexes
+
+Revision ID: 3f1c2a9d7b64
+Revises: 80cca8d4a00b
+Create Date: 2026-10-18 09:12:04.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b64'
+down_revision = '80cca8d4a00b'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+    "name, content='{table}', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+    "INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF name ON {table} BEGIN "
+    "INSERT INTO {fts}({fts}, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO {fts}(rowid, name) VALUES (new.id, new.name); END",
+    "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index('ix_venue_name_trgm', 'venue', ['name'], postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+        op.create_index('ix_artist_name_trgm', 'artist', ['name'], postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        for table in ('venue', 'artist'):
+            for statement in SQLITE_FTS_DDL:
+                op.execute(statement.format(fts=table + '_name_fts', table=table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_artist_name_trgm', table_name='artist')
+        op.drop_index('ix_venue_name_trgm', table_name='venue')
+    elif dialect == 'sqlite':
+        for table in ('venue', 'artist'):
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute('DROP TRIGGER IF EXISTS {}_name_fts_{}'.format(table, trigger))
+            op.execute('DROP TABLE IF EXISTS {}_name_fts'.format(table))
@@ -0,0 +1,49 @@
+"""artist/venue match lists
+
+Revision ID: 5b1d8e07f6a9
+Revises: 0c7e5b93a4d2
+Create Date: 2026-10-18 23:26:08.115930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1d8e07f6a9'
+down_revision = '0c7e5b93a4d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('artist_match',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'venue_id')
+    )
+    op.create_index('ix_artist_match_artist_id_score', 'artist_match', ['artist_id', 'score'], unique=False)
+    op.create_table('venue_match',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id')
+    )
+    op.create_index('ix_venue_match_venue_id_score', 'venue_match', ['venue_id', 'score'], unique=False)
+    # NULL: every artist and venue is matched by the next `flask matches refresh`
+    op.add_column('artist', sa.Column('matched_at', sa.DateTime(), nullable=True))
+    op.add_column('venue', sa.Column('matched_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('venue', 'matched_at')
+    op.drop_column('artist', 'matched_at')
+    op.drop_index('ix_venue_match_venue_id_score', table_name='venue_match')
+    op.drop_table('venue_match')
+    op.drop_index('ix_artist_match_artist_id_score', table_name='artist_match')
+    op.drop_table('artist_match')
@@ -0,0 +1,119 @@
+"""normalised genre tables
+
+Revision ID: a7d2e91c4b3f
+Revises: 3f1c2a9d7b64
+Create Date: 2026-10-18 10:02:47.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e91c4b3f'
+down_revision = '3f1c2a9d7b64'
+branch_labels = None
+depends_on = None
+
+
+# The genre choices offered by the venue/artist forms at the time of this
+# migration; inserted up front so concurrent first uses don't race.
+KNOWN_GENRES = ['Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk',
+                'Hip-Hop', 'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop',
+                'Punk', 'R&B', 'Reggae', 'Rock n Roll', 'Soul', 'Other']
+
+genre = sa.table('genre', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+
+def parse_genres(value):
+    # '{Jazz,"Rock n Roll"}' (Postgres array literal cast to text) -> ['Jazz', 'Rock n Roll']
+    if not value:
+        return []
+    return [name.strip().strip('"') for name in value.strip('{}').split(',') if name.strip().strip('"')]
+
+
+def format_genres(names):
+    return '{' + ','.join('"%s"' % name if ' ' in name else name for name in names) + '}'
+
+
+def genre_ids(connection, names):
+    ids = dict((name, id) for id, name in connection.execute(sa.select(genre.c.id, genre.c.name)))
+    missing = [name for name in dict.fromkeys(names) if name not in ids]
+    if missing:
+        connection.execute(genre.insert(), [{'name': name} for name in missing])
+        ids = dict((name, id) for id, name in connection.execute(sa.select(genre.c.id, genre.c.name)))
+    return ids
+
+
+def upgrade():
+    op.create_table('genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('venue_genre',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_venue_genre_genre_id_venue_id', 'venue_genre', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('artist_genre',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['genre.id'], ),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_artist_genre_genre_id_artist_id', 'artist_genre', ['genre_id', 'artist_id'], unique=False)
+
+    # Convert the array-literal strings into association rows
+    connection = op.get_bind()
+    genre_ids(connection, KNOWN_GENRES)
+    for table in ('venue', 'artist'):
+        source = sa.table(table, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        links = sa.table(table + '_genre', sa.column(table + '_id', sa.Integer), sa.column('genre_id', sa.Integer))
+        rows = [(id, parse_genres(genres)) for id, genres in connection.execute(sa.select(source.c.id, source.c.genres))]
+        ids = genre_ids(connection, [name for _, names in rows for name in names])
+        values = [{table + '_id': id, 'genre_id': ids[name]}
+                  for id, names in rows for name in dict.fromkeys(names)]
+        if values:
+            connection.execute(links.insert(), values)
+
+    # recreate='never': a table rebuild on SQLite would drop the name search
+    # triggers from 3f1c2a9d7b64 (needs SQLite >= 3.35 for DROP COLUMN)
+    with op.batch_alter_table('venue', recreate='never') as batch_op:
+        batch_op.drop_column('genres')
+    with op.batch_alter_table('artist', recreate='never') as batch_op:
+        batch_op.drop_column('genres')
+
+
+def downgrade():
+    op.add_column('venue', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+    op.add_column('artist', sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+
+    connection = op.get_bind()
+    for table in ('venue', 'artist'):
+        target = sa.table(table, sa.column('id', sa.Integer), sa.column('genres', sa.String))
+        links = sa.table(table + '_genre', sa.column(table + '_id', sa.Integer), sa.column('genre_id', sa.Integer))
+        names = {}
+        query = sa.select(links.c[table + '_id'], genre.c.name)\
+            .select_from(links.join(genre, links.c.genre_id == genre.c.id))\
+            .order_by(links.c[table + '_id'], genre.c.name)
+        for id, name in connection.execute(query):
+            names.setdefault(id, []).append(name)
+        for id, genres in names.items():
+            connection.execute(target.update().where(target.c.id == id).values(genres=format_genres(genres)))
+        connection.execute(target.update().where(target.c.genres.is_(None)).values(genres='{}'))
+        if connection.dialect.name != 'sqlite':
+            # SQLite can only tighten the constraint by rebuilding the table,
+            # which would drop the name search triggers; the column stays nullable there.
+            op.alter_column(table, 'genres', nullable=False)
+
+    op.drop_index('ix_artist_genre_genre_id_artist_id', table_name='artist_genre')
+    op.drop_table('artist_genre')
+    op.drop_index('ix_venue_genre_genre_id_venue_id', table_name='venue_genre')
+    op.drop_table('venue_genre')
+    op.drop_table('genre')
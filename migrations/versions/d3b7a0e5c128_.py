@@ -0,0 +1,37 @@
+"""updated_at columns for conditional GET
+
+Revision ID: d3b7a0e5c128
+Revises: c52e8f0a9d16
+Create Date: 2026-10-18 11:17:52.661043
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b7a0e5c128'
+down_revision = 'c52e8f0a9d16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't add a column with a non-constant default, so existing rows
+    # get a constant first. Either way they are then stamped with the current
+    # local time, which is what the app writes (CURRENT_TIMESTAMP is UTC on
+    # SQLite and the session's time zone on PostgreSQL).
+    sqlite = op.get_bind().dialect.name == 'sqlite'
+    default = sa.text("'1970-01-01 00:00:00'") if sqlite else sa.text('CURRENT_TIMESTAMP')
+    now = datetime.now()
+    for table in ('venue', 'artist', 'show'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=default, nullable=False))
+        op.execute(sa.text('UPDATE %s SET updated_at = :now' % table).bindparams(now=now))
+        op.create_index(op.f('ix_%s_updated_at' % table), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('show', 'artist', 'venue'):
+        op.drop_index(op.f('ix_%s_updated_at' % table), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,47 @@
+"""maintained upcoming/past show counters
+
+Revision ID: e8f1c6a2b947
+Revises: d3b7a0e5c128
+Create Date: 2026-10-18 20:02:14.318520
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8f1c6a2b947'
+down_revision = 'd3b7a0e5c128'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('show', sa.Column('counted_upcoming', sa.Boolean(), server_default=sa.false(), nullable=False))
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+        op.create_index(op.f('ix_%s_upcoming_shows_count' % table), table, ['upcoming_shows_count'], unique=False)
+
+    # Same as fyyur.counters.rebuild(); the app compares against local time
+    op.execute(sa.text('UPDATE show SET counted_upcoming = (start_time > :now)').bindparams(now=datetime.now()))
+    for table in ('venue', 'artist'):
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id '
+            'AND show.counted_upcoming), '
+            'past_shows_count = (SELECT count(*) FROM show WHERE show.{table}_id = {table}.id '
+            'AND NOT show.counted_upcoming)'.format(table=table))
+
+    op.create_index('ix_show_counted_upcoming_start_time', 'show', ['start_time'], unique=False,
+                    postgresql_where=sa.text('counted_upcoming'), sqlite_where=sa.text('counted_upcoming'))
+
+
+def downgrade():
+    op.drop_index('ix_show_counted_upcoming_start_time', table_name='show')
+    for table in ('artist', 'venue'):
+        op.drop_index(op.f('ix_%s_upcoming_shows_count' % table), table_name=table)
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
+    op.drop_column('show', 'counted_upcoming')
@@ -0,0 +1,41 @@
+"""offline place table and venue locations
+
+Revision ID: f2a9c4d81e3b
+Revises: e8f1c6a2b947
+Create Date: 2026-10-18 21:14:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9c4d81e3b'
+down_revision = 'e8f1c6a2b947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('place',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=False),
+    sa.Column('longitude', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('city', 'state', name='uq_place_city_state')
+    )
+    op.add_column('venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_venue_geohash'), 'venue', ['geohash'], unique=False)
+    # Venues are located by `flask geocode venues` once places are loaded
+
+
+def downgrade():
+    op.drop_index(op.f('ix_venue_geohash'), table_name='venue')
+    op.drop_column('venue', 'geohash')
+    op.drop_column('venue', 'longitude')
+    op.drop_column('venue', 'latitude')
+    op.drop_table('place')